@@ -14,7 +14,11 @@ import base64
 import json
 import datetime
 import time
+import copy
 from colony_analyzer import ColonyAnalyzer
+from batch_engine import iter_batch_results
+from result_cache import ResultCache
+from color_palette import ColorPalette
 # Authentication removed for direct access
 
 st.set_page_config(
@@ -77,6 +81,11 @@ def clean_stale_media_references():
                             if img_key in results:
                                 del results[img_key]
 
+@st.cache_resource
+def get_result_cache():
+    # one on-disk result cache shared by every session of this server
+    return ResultCache()
+
 def initialize_run_history():
     # initialize run history in session state
     if 'run_history' not in st.session_state:
@@ -463,6 +472,13 @@ def main():
                 else:
                     use_fast_mode = False
                 
+                use_color_palette = st.checkbox(
+                    "🎨 Shared color palette",
+                    value=False,
+                    help="Assign colony colors to one palette shared by all samples so color clusters mean the same color on every plate. "
+                         "The first run fits the palette, later runs reuse it and refine it with each new plate."
+                )
+                
                 # Auto-generate labels or allow custom labeling
                 label_method = st.radio(
                     "Sample labeling method:",
@@ -523,8 +539,12 @@ def main():
         st.header("Colony Detection")
         st.caption("Configure colony segmentation parameters")
         
+        plate_shape = st.selectbox("Plate shape", ["rect", "circle"],
+                                   format_func=lambda shape: "Rectangular" if shape == "rect" else "Circular (round dish)",
+                                   help="Rectangular plates use an edge margin, round dishes are located by fitting the rim")
+        
         margin_percent = st.slider("Plate margin percent", 0.05, 0.20, 0.08, 0.01,
-                                  help="Percentage of image edges to exclude from plate detection")
+                                  help="Percentage of image edges (or dish rim) to exclude from plate detection")
         
         min_colony_size = st.slider("Min colony size", 10, 50, 15,
                                    help="Minimum area in pixels for a colony to be considered valid")
@@ -548,6 +568,9 @@ def main():
                                             help="Random seed for consistent color clustering")
         color_n_init = st.slider("KMeans n_init", 1, 20, 10,
                                 help="Number of times to run K-means with different seeds")
+        color_k_search = st.selectbox("Cluster count search", ["full", "warm", "minibatch"],
+                                      help="How the number of color groups is chosen: full = every k with n_init restarts, "
+                                           "warm = each k starts from the previous one (faster), minibatch = warm start on mini-batches (fastest)")
         
         st.header("Top Colonies & Scoring")
         st.caption("Select and rank the most interesting colonies")
@@ -581,6 +604,7 @@ def main():
                     gamma=gamma,
                     sharpen_strength=sharpen_strength,
                     margin_percent=margin_percent,
+                    plate_shape=plate_shape,
                     adaptive_block_size=adaptive_block_size,
                     adaptive_c=adaptive_c,
                     min_colony_size=min_colony_size,
@@ -590,6 +614,7 @@ def main():
                     color_n_clusters=(color_n_clusters if color_n_clusters > 0 else None),
                     color_random_state=color_random_state,
                     color_n_init=color_n_init,
+                    color_k_search=color_k_search,
                     n_top_colonies=n_top_colonies,
                     penalty_factor=penalty_factor
                 )
@@ -615,6 +640,7 @@ def main():
                     st.session_state.sample_labels = sample_labels
                     st.session_state.params = current_params
                     st.session_state.use_fast_mode = use_fast_mode  # Store fast mode setting
+                    st.session_state.use_color_palette = use_color_palette
                     st.session_state.analysis_mode = "multi"
                     # Clear cached results to force re-analysis
                     if 'multi_analysis_results' in st.session_state:
@@ -841,10 +867,6 @@ def main():
                 if 'watershed' not in params:
                     params['watershed'] = True  # Add required parameter
                 
-                # save uploaded file temporarily
-                with open("temp_image.jpg", "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                
                 # Check if we need to re-run analysis or use cached results
                 if 'analysis_results' not in st.session_state:
                     # run analysis with detailed progress
@@ -863,8 +885,28 @@ def main():
                         sys.stdout = captured_output
                         
                         try:
-                            analyzer = ColonyAnalyzer(**params)
-                            results = analyzer.run_full_analysis("temp_image.jpg")
+                            # identical image + parameters + code version are served from the on-disk cache
+                            result_cache = get_result_cache()
+                            cache_key = result_cache.make_key(uploaded_file, params)
+                            results = result_cache.get(cache_key)
+                            
+                            if results is not None:
+                                print("loaded analysis results from cache")
+                            else:
+                                # reuse this session's analyzer so only the stages affected by changed sliders re-run
+                                analyzer = st.session_state.get('analyzer')
+                                if analyzer is None:
+                                    analyzer = ColonyAnalyzer(**params)
+                                    st.session_state.analyzer = analyzer
+                                else:
+                                    analyzer.set_params(**params)
+                                # decode straight from the upload buffer, nothing is written to disk
+                                results = analyzer.run_full_analysis(uploaded_file)
+                                
+                                # add binary mask to results
+                                if results is not None:
+                                    results['final_binary_mask'] = analyzer.final_binary_mask
+                                    result_cache.put(cache_key, results)
                             
                             # Get captured progress messages
                             progress_messages = captured_output.getvalue()
@@ -878,9 +920,13 @@ def main():
                             with st.expander("View Detailed Analysis Steps", expanded=False):
                                 st.text(progress_messages)
                         
-                        # add binary mask to results
-                        if hasattr(analyzer, 'final_binary_mask'):
-                            results['final_binary_mask'] = analyzer.final_binary_mask
+                        # where the time went, per pipeline stage (not available for results served from the disk cache)
+                        if results is not None and results.get('stage_timings') is not None:
+                            with st.expander("Stage Timings", expanded=False):
+                                timings = results['stage_timings']
+                                st.dataframe(timings, use_container_width=True)
+                                st.caption(f"Total stage time: {timings['wall_s'].sum():.2f}s")
+                        
                         # Cache the results
                         st.session_state.analysis_results = results
                         st.session_state.params = params
@@ -899,11 +945,6 @@ def main():
                     display_results(results, params.get('n_top_colonies', 20))
                 else:
                     st.error(" Analysis failed. Please check your image and try again.")
-                
-                # cleanup
-                import os
-                if os.path.exists("temp_image.jpg"):
-                    os.remove("temp_image.jpg")
             
             elif analysis_mode == 'multi' and 'uploaded_files' in st.session_state:
                 # Multi-image analysis
@@ -911,6 +952,7 @@ def main():
                 sample_labels = st.session_state.get('sample_labels', {})
                 stored_params = st.session_state.get('params', {})
                 use_fast_mode = st.session_state.get('use_fast_mode', False)
+                use_color_palette = st.session_state.get('use_color_palette', False)
                 
                 # Check if we need to re-run analysis or use cached results
                 if 'multi_analysis_results' not in st.session_state:
@@ -923,7 +965,8 @@ def main():
                     status_text.text(f"Starting {mode_text} analysis for {len(uploaded_files)} images...")
                     
                     try:
-                        results = run_multi_image_analysis(uploaded_files, sample_labels, stored_params, use_fast_mode, progress_bar, status_text)
+                        results = run_multi_image_analysis(uploaded_files, sample_labels, stored_params, use_fast_mode, progress_bar, status_text,
+                                                           use_color_palette=use_color_palette)
                         st.session_state.multi_analysis_results = results
                         
                         # Final status
@@ -1274,7 +1317,18 @@ def display_color_analysis(results):
                 file_name="color_clusters.png",
                 mime="image/png"
             )
-    
+
+        # elbow search behind the number of clusters
+        curve = results.get('color_inertia_curve')
+        if curve is not None and not curve.empty:
+            with st.expander("Cluster count search (inertia per k)"):
+                fig_curve = px.line(curve, x='k', y='inertia', markers=True, title="KMeans Inertia by Cluster Count")
+                chosen = curve[curve['selected']]
+                fig_curve.add_scatter(x=chosen['k'], y=chosen['inertia'], mode='markers', name='chosen k',
+                                      marker=dict(size=14, symbol='star'))
+                st.plotly_chart(fig_curve, use_container_width=True)
+                st.dataframe(curve, use_container_width=True)
+
     else:
         st.warning("No color analysis data available")
 
@@ -1667,94 +1721,110 @@ def display_binary_mask(results, n_top_colonies):
     else:
         st.warning("No binary mask available.")
 
-def run_multi_image_analysis(uploaded_files, sample_labels, params, use_fast_mode=False, progress_bar=None, status_text=None):
-    # memory-efficient analysis for large batches with progress tracking
+def run_multi_image_analysis(uploaded_files, sample_labels, params, use_fast_mode=False, progress_bar=None, status_text=None, max_workers=None,
+                             use_color_palette=False):
+    # analyze a batch of images across a process pool, progress is reported as each image finishes
+    # with use_color_palette every plate is assigned to the saved global color palette (fitted from this batch if none exists yet)
     mode_desc = "fast" if use_fast_mode else "standard"
     print(f"starting {mode_desc} multi image analysis for {len(uploaded_files)} files")
     
-    all_results = {}
-    combined_data = []
     total_files = len(uploaded_files)
     start_time = time.time()
     
-    for i, uploaded_file in enumerate(uploaded_files):
-        # Simplified progress updates (less frequent to avoid slowdown)
-        if i % 3 == 0 or i == total_files - 1:  # Update every 3 images or on last image
-            progress = int((i / total_files) * 100)
-            if progress_bar:
-                progress_bar.progress(progress)
+    # Apply speed optimizations if fast mode enabled
+    analysis_params = params.copy()
+    if use_fast_mode:
+        # Speed optimizations - process faster with less detail
+        analysis_params['bilateral_d'] = 5  # faster filtering (vs default 9)
+        analysis_params['clahe_clip_limit'] = 2.0  # lighter enhancement (vs default 3.0) 
+        analysis_params['adaptive_block_size'] = 17  # larger blocks for speed (vs default 15)
+        analysis_params['color_n_init'] = 3  # fewer k-means iterations (vs default 10)
+        analysis_params['color_k_search'] = 'warm'  # one warm-started fit per k (vs n_init restarts per k)
+        print(f"fast mode optimizations applied")
+    
+    palette = None
+    if use_color_palette:
+        palette = ColorPalette.load() or ColorPalette()
+        if palette.fitted:
+            # workers get a snapshot, so every plate of this batch is assigned with the same palette
+            analysis_params['color_palette'] = copy.deepcopy(palette)
+            print(f"assigning colors with the shared palette ({palette.n_colonies} colonies seen so far)")
+    reference_colors = []
+    
+    # image bytes are read lazily so only the images in flight are copied to the workers
+    jobs = ((i, uploaded_file.name, uploaded_file.getvalue()) for i, uploaded_file in enumerate(uploaded_files))
+    
+    # workers finish out of order, results are collected by upload index
+    finished = {}
+    for done, outcome in enumerate(iter_batch_results(jobs, analysis_params, max_workers=max_workers), start=1):
+        i, name = outcome['index'], outcome['name']
+        finished[i] = outcome
+        
+        if progress_bar:
+            progress_bar.progress(int((done / total_files) * 100))
+        
+        if outcome['error'] is not None:
+            print(f"error processing {name}: {outcome['error']}")
+            if status_text:
+                status_text.text(f"❌ Failed on {name} ({done}/{total_files})")
+        elif outcome['results'] is not None:
+            colony_count = len(outcome['results']['combined_df'])
+            lab_colors = outcome['results'].get('colony_lab_colors')
+            if palette is not None and lab_colors is not None:
+                # refine the palette as plates stream in, or keep the colors to fit it after the batch
+                if palette.fitted:
+                    palette.partial_fit(lab_colors)
+                else:
+                    reference_colors.append(lab_colors)
             if status_text:
-                status_text.text(f"📸 Processing {i+1}/{total_files}: {uploaded_file.name}")
+                status_text.text(f"✅ Found {colony_count} colonies in {name} ({done}/{total_files})")
+            print(f"successfully processed {name}: {colony_count} colonies")
+        else:
+            if status_text:
+                status_text.text(f"⚠️ No colonies detected in {name} ({done}/{total_files})")
+            print(f"no colonies detected in {name}")
+    
+    print(f"batch finished in {time.time() - start_time:.1f}s")
+    
+    if palette is not None:
+        relabel = not palette.fitted
+        if relabel and reference_colors:
+            try:
+                palette.fit(np.concatenate(reference_colors))
+            except ValueError as e:
+                print(f"color palette not fitted: {e}")
+        if palette.fitted:
+            if relabel:
+                # this batch was the reference set, move its plates onto the new palette ids and rescore them
+                print(f"fitted shared color palette on {palette.n_colonies} colonies")
+                for outcome in finished.values():
+                    if outcome['results'] is not None:
+                        assign_palette_colors(outcome['results'], analysis_params, palette)
+            try:
+                palette.save()
+            except OSError as e:
+                print(f"could not save color palette: {e}")
+    
+    all_results = {}
+    combined_data = []
+    for i, uploaded_file in enumerate(uploaded_files):
+        outcome = finished.get(i)
+        if outcome is None or outcome['results'] is None:
+            continue
         
-        print(f"processing {i+1}/{total_files}: {uploaded_file.name}")
+        # get sample label
+        sample_name = sample_labels.get(uploaded_file.name, f"Sample_{i+1}")
         
-        try:
-            # save temporary file
-            temp_filename = f"temp_image_{i}.jpg"
-            with open(temp_filename, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            
-            # Apply speed optimizations if fast mode enabled
-            analysis_params = params.copy()
-            if use_fast_mode:
-                # Speed optimizations - process faster with less detail
-                analysis_params['bilateral_d'] = 5  # faster filtering (vs default 9)
-                analysis_params['clahe_clip_limit'] = 2.0  # lighter enhancement (vs default 3.0) 
-                analysis_params['adaptive_block_size'] = 17  # larger blocks for speed (vs default 15)
-                analysis_params['color_n_init'] = 3  # fewer k-means iterations (vs default 10)
-                print(f"fast mode optimizations applied")
-            
-            analyzer = ColonyAnalyzer(**analysis_params)
-            results = analyzer.run_full_analysis(temp_filename)
-            
-            # get sample label
-            sample_name = sample_labels.get(uploaded_file.name, f"Sample_{i+1}")
-            
-            # Memory optimization: only store essential data, no images
-            if results and 'combined_df' in results and len(results.get('colony_properties', [])) > 0:
-                essential_results = {
-                    'colony_properties': results.get('colony_properties', []),
-                    'combined_df': results.get('combined_df', pd.DataFrame()),
-                    'sample_name': sample_name
-                }
-                all_results[sample_name] = essential_results
-                
-                # extract features for comparison
-                df = results['combined_df'].copy()
-                df['sample'] = sample_name
-                df['image_name'] = uploaded_file.name
-                combined_data.append(df)
-                
-                # Update status for successful processing
-                colony_count = len(df)
-                if status_text:
-                    status_text.text(f"✅ Found {colony_count} colonies in {uploaded_file.name} ({i+1}/{total_files})")
-                print(f"successfully processed {uploaded_file.name}: {colony_count} colonies")
-            else:
-                if status_text:
-                    status_text.text(f"⚠️ No colonies detected in {uploaded_file.name} ({i+1}/{total_files})")
-                print(f"no colonies detected in {uploaded_file.name}")
-            
-            # cleanup immediately
-            import os
-            if os.path.exists(temp_filename):
-                os.remove(temp_filename)
-            
-            # Force garbage collection after every 5 images
-            if (i + 1) % 5 == 0:
-                import gc
-                gc.collect()
-                if status_text:
-                    status_text.text(f"🧹 Memory cleanup after {i+1} images...")
-                print(f"memory cleanup after {i+1} images")
-                
-        except Exception as e:
-            print(f"error processing {uploaded_file.name}: {e}")
-            # cleanup on error
-            import os
-            if os.path.exists(temp_filename):
-                os.remove(temp_filename)
-            continue
+        # Memory optimization: only store essential data, no images
+        essential_results = outcome['results']
+        essential_results['sample_name'] = sample_name
+        all_results[sample_name] = essential_results
+        
+        # extract features for comparison
+        df = essential_results['combined_df'].copy()
+        df['sample'] = sample_name
+        df['image_name'] = uploaded_file.name
+        combined_data.append(df)
     
     if not combined_data:
         return None
@@ -1789,6 +1859,35 @@ def run_multi_image_analysis(uploaded_files, sample_labels, params, use_fast_mod
     print(f"multi-image analysis complete: {len(all_results)} samples, {len(combined_df)} total colonies")
     return comparison_results
 
+# score columns combine_analyses merges into combined_df, recomputed when a plate moves onto the color palette
+PALETTE_SCORE_COLUMNS = ['bio_interest', 'morphology_score', 'density_score', 'form_score']
+
+def assign_palette_colors(essential_results, params, palette):
+    # move a plate analyzed without the palette onto the shared palette color ids, and redo what depends on them:
+    # color rarity and combo novelty in the scores, and the diverse top colony selection
+    # gives the same tables as analyzing the plate with color_palette set (the colors stage feeds only scores / selection)
+    lab_colors = essential_results.get('colony_lab_colors')
+    if lab_colors is None or len(lab_colors) == 0:
+        return
+    clusters = pd.Series(palette.assign(lab_colors), index=essential_results['colony_color_ids'])
+    for data in essential_results.get('colony_data') or []:
+        data['color_cluster'] = int(clusters[data['colony_id']])
+    
+    df = essential_results['combined_df']
+    has_color = df['colony_id'].isin(clusters.index)
+    df.loc[has_color, 'color_cluster'] = clusters.loc[df.loc[has_color, 'colony_id']].to_numpy()
+    df['color_class'] = 'color_group_' + df['color_cluster'].astype(int).astype(str)
+    
+    analyzer = ColonyAnalyzer(**{**params, 'color_palette': palette})
+    base_df = df.drop(columns=[col for col in PALETTE_SCORE_COLUMNS if col in df.columns])
+    scores_df = analyzer.calculate_scores(base_df)
+    essential_results['combined_df'] = analyzer.combine_analyses(base_df, [], pd.DataFrame(), scores_df)
+    if 'scores_df' in essential_results:
+        essential_results['scores_df'] = scores_df
+    if 'top_colonies' in essential_results:
+        essential_results['top_colonies'] = analyzer.select_top_colonies(scores_df, n=analyzer.n_top_colonies,
+                                                                         penalty_factor=analyzer.penalty_factor)
+
 def run_pca_analysis(combined_df, feature_set='morphology'):
     # performs pca on colony features to identify variability patterns
     from sklearn.decomposition import PCA
@@ -0,0 +1,98 @@
+# batch_engine.py
+# process pool for analyzing many plate images at once
+# each worker runs a full ColonyAnalyzer pipeline and sends back only the small per-sample tables
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from colony_analyzer import ColonyAnalyzer
+from result_cache import ResultCache
+
+
+def default_worker_count():
+    # a 12MP plate needs a few hundred MB while it is analyzed, so cap the pool
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def analyze_image_job(index, name, image_bytes, params, use_cache=True):
+    # worker entry point: analyze one uploaded image and return its essential results
+    try:
+        import cv2
+        cv2.setNumThreads(1)  # one opencv thread per worker, the pool provides the parallelism
+
+        results = None
+        if use_cache:
+            result_cache = ResultCache()
+            cache_key = result_cache.make_key(image_bytes, params)
+            results = result_cache.get(cache_key)
+
+        if results is None:
+            # the encoded bytes are decoded in memory, no temp file is written
+            analyzer = ColonyAnalyzer(**params)
+            results = analyzer.run_full_analysis(image_bytes)
+            if use_cache and results is not None:
+                results['final_binary_mask'] = analyzer.final_binary_mask
+                result_cache.put(cache_key, results)
+
+        if not results or 'combined_df' not in results or len(results.get('colony_properties', [])) == 0:
+            return {'index': index, 'name': name, 'results': None, 'error': None}
+
+        essential_results = {
+            # only the label / area / bbox / centroid columns, the label image stays in the worker
+            'colony_properties': results['colony_properties'].compact(),
+            'combined_df': results['combined_df'],
+            # lab color per colony, for fitting / refining a shared color palette in the parent
+            'colony_lab_colors': results.get('colony_lab_colors'),
+            'colony_color_ids': [data['colony_id'] for data in results.get('colony_data', [])],
+        }
+        return {'index': index, 'name': name, 'results': essential_results, 'error': None}
+    except Exception as e:
+        return {'index': index, 'name': name, 'results': None, 'error': str(e)}
+
+
+def iter_batch_results(jobs, params, max_workers=None, max_tasks_per_child=None, use_cache=True):
+    # analyze (index, name, image_bytes) jobs and yield each outcome as soon as it finishes
+    # at most 2 jobs per worker are in flight so queued image bytes stay bounded
+    # workers live for the whole batch by default, since a fresh (spawned) worker re-imports cv2 / sklearn /
+    # skimage; pass max_tasks_per_child to replace them after that many images and release their memory
+    # (python 3.11+, ignored on older versions)
+    if max_workers is None:
+        max_workers = default_worker_count()
+
+    jobs = iter(jobs)
+
+    if max_workers <= 1:
+        # no pool, useful on single-core containers and for debugging
+        for index, name, image_bytes in jobs:
+            yield analyze_image_job(index, name, image_bytes, params, use_cache)
+        return
+
+    pool_kwargs = {}
+    if max_tasks_per_child is not None and sys.version_info >= (3, 11):
+        pool_kwargs['max_tasks_per_child'] = max_tasks_per_child
+
+    with ProcessPoolExecutor(max_workers=max_workers, **pool_kwargs) as pool:
+        pending = {}
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < 2 * max_workers:
+                try:
+                    index, name, image_bytes = next(jobs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = pool.submit(analyze_image_job, index, name, image_bytes, params, use_cache)
+                pending[future] = (index, name)
+
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index, name = pending.pop(future)
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    # a worker that dies (e.g. killed for memory) only fails its own image
+                    outcome = {'index': index, 'name': name, 'results': None, 'error': str(e)}
+                yield outcome
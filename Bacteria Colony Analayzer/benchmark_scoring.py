@@ -0,0 +1,74 @@
+# benchmark_scoring.py
+# times ColonyAnalyzer.calculate_scores on colony_analysis_data.csv replicated to ~1M colonies
+# and checks it against the original row-by-row scoring (kept here only as a reference),
+# then times select_top_colonies picking n_picks diverse colonies from the scored pool
+# usage: python benchmark_scoring.py [n_rows] [n_picks]
+
+import io
+import os
+import sys
+import time
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+from colony_analyzer import ColonyAnalyzer
+
+
+def legacy_scores(combined_df):
+    # the original Series.map(lambda ...) scoring, returns the columns the vectorized version replaced
+    scores = pd.DataFrame(index=combined_df.index)
+    freq_f = combined_df['form'].value_counts(normalize=True)
+    scores['form_score'] = combined_df['form'].map(lambda x: (1-freq_f[x])**0.8)
+    interest = {'entire':0.2,'undulate':0.6,'serrate':1.0,'lobate':0.8,'unknown':0.5}
+    scores['margin_score'] = combined_df['margin'].map(lambda x: interest.get(x,0.5))
+    combo = combined_df['color_cluster'].astype(str)+'_'+combined_df['form'].astype(str)
+    freq_combo = combo.value_counts(normalize=True)
+    scores['novelty_combo'] = combo.map(lambda x: (1-freq_combo[x])*0.3 if freq_combo[x]<0.03 else 0)
+    pen_vals = np.zeros(len(combined_df))
+    freq_c = combined_df['color_cluster'].value_counts(normalize=True)
+    pen_vals += combined_df['color_cluster'].map(lambda x: freq_c[x]**2)
+    pen_vals += combined_df['form'].map(lambda x: freq_f[x]**2)
+    pen_vals += combo.map(lambda x: freq_combo[x]**2)
+    scores['penalty'] = (pen_vals/3) * 0.7
+    return scores
+
+
+def replicated_table(n_rows):
+    # stack copies of the sample plate, each copy gets its own colony ids and a shifted color cluster
+    # range so the merged table has the mix of common and rare combos a multi-plate run produces
+    csv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'colony_analysis_data.csv')
+    base = pd.read_csv(csv_path).drop(columns=['bio_interest'])
+    copies = -(-n_rows // len(base))
+    df = pd.concat([base] * copies, ignore_index=True).iloc[:n_rows].copy()
+    plate = np.arange(len(df)) // len(base)
+    df['colony_id'] = np.arange(len(df))
+    df['color_cluster'] = df['color_cluster'] + (plate % 50) * 10
+    return df
+
+
+if __name__ == "__main__":
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    n_picks = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    df = replicated_table(n_rows)
+    analyzer = ColonyAnalyzer()
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        scores = analyzer.calculate_scores(df)
+    vector_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reference = legacy_scores(df)
+    legacy_time = time.perf_counter() - start
+
+    print(f"{len(df)} colonies: calculate_scores {vector_time:.2f}s, "
+          f"row-by-row lookups alone {legacy_time:.2f}s")
+    for column in reference.columns:
+        same = np.array_equal(scores[column].to_numpy(float), reference[column].to_numpy(float))
+        print(f"  {column}: {'identical' if same else 'DIFFERENT'}")
+
+    start = time.perf_counter()
+    top = analyzer.select_top_colonies(scores, n=n_picks)
+    print(f"select_top_colonies: {len(top)} picks in {time.perf_counter() - start:.2f}s")
@@ -5,14 +5,23 @@
 import cv2
 import numpy as np
 import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from scipy import ndimage
-from skimage import filters, morphology, measure, segmentation, color
+from skimage import filters, morphology, segmentation
 from skimage.feature import peak_local_max
 import pandas as pd
 import seaborn as sns
 import warnings
 import random
+import os
+import hashlib
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from color_utils import rgb_to_lab_batch
+from result_cache import image_content_hash
+from colony_table import ColonyTable
+from diverse_selection import select_diverse_indices
+from stage_profiler import StageProfiler, append_trace
 warnings.filterwarnings('ignore')
 
 # Set all random seeds for reproducibility
@@ -20,6 +29,23 @@ np.random.seed(42)
 random.seed(42)
 
 class ColonyAnalyzer:
+    # analysis stages in run order: (stage, parameters it reads, upstream stages)
+    # a stage is re-run only when its own parameters or an upstream stage changed
+    STAGE_GRAPH = [
+        ('load', (), ()),
+        ('preprocess', ('bilateral_d', 'bilateral_sigma_color', 'bilateral_sigma_space',
+                        'clahe_clip_limit', 'clahe_tile_grid', 'gamma', 'sharpen_strength'), ('load',)),
+        ('plate', ('margin_percent', 'plate_shape'), ('preprocess',)),
+        ('segment', ('adaptive_block_size', 'adaptive_c', 'min_colony_size', 'max_colony_size',
+                     'min_distance', 'watershed'), ('preprocess', 'plate')),
+        ('morphology', (), ('segment',)),
+        ('colors', ('color_n_clusters', 'color_random_state', 'color_n_init', 'dominant_color_method',
+                    'color_k_search', 'color_search_samples', 'color_palette'), ('preprocess', 'segment')),
+        ('density', (), ('preprocess', 'plate', 'segment')),
+        ('scores', (), ('morphology', 'colors', 'density')),
+        ('selection', ('n_top_colonies', 'penalty_factor'), ('scores',)),
+    ]
+
     def __init__(self,
                  bilateral_d=9,
                  bilateral_sigma_color=75,
@@ -29,6 +55,7 @@ class ColonyAnalyzer:
                  gamma=1.2,
                  sharpen_strength=1.0,
                  margin_percent=0.08,
+                 plate_shape='rect',  # 'rect' (margin rectangle) or 'circle' (round dish, hough + ellipse fit)
                  adaptive_block_size=15,
                  adaptive_c=3,
                  min_colony_size=15,
@@ -38,8 +65,16 @@ class ColonyAnalyzer:
                  color_n_clusters=None,
                  color_random_state=42,
                  color_n_init=10,
+                 dominant_color_method='batch',  # 'batch' (vectorized) or 'kmeans' (legacy per-colony KMeans)
+                 color_k_search='full',  # elbow search: 'full' (n_init restarts per k), 'warm' or 'minibatch' (warm-started k)
+                 color_search_samples=None,  # run the elbow search on at most this many colonies, None = all
+                 color_palette=None,  # fitted color_palette.ColorPalette: assign global color clusters instead of clustering per plate
                  n_top_colonies=50,  # Always select more colonies than needed for display flexibility
-                 penalty_factor=0.5):
+                 penalty_factor=0.5,
+                 n_jobs=1,  # worker threads for the analysis stages, None or < 1 = all cpus
+                 preprocess_tile_rows='auto',  # strip height for tiled preprocessing, None = whole image, 'auto' = tile large scans
+                 profile_memory=False,  # also record per-stage python/numpy allocation peaks with tracemalloc (slower)
+                 trace_path=None):  # append one json line of stage timings per run to this file
         self.bilateral_d = bilateral_d
         self.bilateral_sigma_color = bilateral_sigma_color
         self.bilateral_sigma_space = bilateral_sigma_space
@@ -48,6 +83,7 @@ class ColonyAnalyzer:
         self.gamma = gamma
         self.sharpen_strength = sharpen_strength
         self.margin_percent = margin_percent
+        self.plate_shape = plate_shape
         self.adaptive_block_size = adaptive_block_size
         self.adaptive_c = adaptive_c
         self.min_colony_size = min_colony_size
@@ -57,8 +93,18 @@ class ColonyAnalyzer:
         self.color_n_clusters = color_n_clusters
         self.color_random_state = color_random_state
         self.color_n_init = color_n_init
+        self.dominant_color_method = dominant_color_method
+        self.color_k_search = color_k_search
+        self.color_search_samples = color_search_samples
+        self.color_palette = color_palette
         self.n_top_colonies = n_top_colonies
         self.penalty_factor = penalty_factor
+        self.n_jobs = n_jobs
+        # analysis stages running side by side, each one's colony chunks get an equal share of the workers
+        self.concurrent_stages = 1
+        self.preprocess_tile_rows = preprocess_tile_rows
+        self.profile_memory = profile_memory
+        self.trace_path = trace_path
         # results
         self.original_image = None
         self.processed_image = None
@@ -68,22 +114,59 @@ class ColonyAnalyzer:
         self.colony_properties = None
         self.morph_df = None
         self.colony_data = None
+        self.color_inertia_curve = None
+        self.colony_lab_colors = None
         self.density_df = None
         self.combined_df = None
         self.scores_df = None
         self.top_colonies = None
         self.final_binary_mask = None
-        
-    def load_image(self, image_path):
+        self.colony_distance_map = None
+        # stage cache for incremental re-runs: stage -> fingerprint / outputs
+        self.stage_fingerprints = {}
+        self.stage_outputs = {}
+        self.last_run_stages = []
+        self.stage_timings = None
+        
+    def set_params(self, **params):
+        # change analysis parameters in place, cached stages that do not depend on them are kept
+        valid = inspect.signature(type(self).__init__).parameters
+        for name, value in params.items():
+            if name == 'self' or name not in valid:
+                raise TypeError(f"unknown ColonyAnalyzer parameter: {name}")
+            setattr(self, name, value)
+        return self
+    
+    def stage_fingerprints_for(self, image_key):
+        # fingerprint of every stage from its own parameter values and its upstream fingerprints
+        fingerprints = {}
+        for stage, params, upstream in self.STAGE_GRAPH:
+            payload = repr((stage, image_key if stage == 'load' else None,
+                            [(name, getattr(self, name)) for name in params],
+                            [fingerprints[name] for name in upstream]))
+            fingerprints[stage] = hashlib.sha256(payload.encode()).hexdigest()
+        return fingerprints
+    
+    def load_image(self, image_source):
         # load and convert image to rgb format
+        # image_source can be a file path, encoded bytes / memoryview / file-like upload,
+        # or an already decoded rgb (or grayscale) numpy array
         print("loading microbiome plate image")
         
-        original_image = cv2.imread(image_path)
+        if isinstance(image_source, np.ndarray) and image_source.ndim >= 2:
+            original_image = self.decoded_array_to_rgb(image_source)
+        else:
+            if isinstance(image_source, (str, os.PathLike)):
+                original_image = cv2.imread(os.fspath(image_source))
+            else:
+                original_image = self.decode_image_buffer(image_source)
+            if original_image is not None:
+                original_image = cv2.cvtColor(original_image, cv2.COLOR_BGR2RGB)
+        
         if original_image is None:
             print("error loading image")
             return None
             
-        original_image = cv2.cvtColor(original_image, cv2.COLOR_BGR2RGB)
         self.original_image = original_image
         
         h, w, c = original_image.shape
@@ -91,91 +174,331 @@ class ColonyAnalyzer:
         
         return original_image
     
+    def decode_image_buffer(self, image_source):
+        # decode encoded image bytes (jpg/png/tif...) straight from memory with imdecode
+        # file-like uploads are read through getbuffer() when available so the bytes are not copied
+        if hasattr(image_source, 'getbuffer'):
+            image_source = image_source.getbuffer()
+        elif hasattr(image_source, 'read'):
+            image_source = image_source.read()
+        
+        try:
+            encoded = np.frombuffer(image_source, dtype=np.uint8)
+        except TypeError:
+            return None
+        if encoded.size == 0:
+            return None
+        return cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+    
+    def decoded_array_to_rgb(self, image_array):
+        # accept rgb, rgba or grayscale arrays and return 8-bit rgb, 8-bit rgb input is used as is
+        # float arrays are taken as 0..1 intensities (skimage / matplotlib convention) and scaled to 0..255
+        image_array = np.asarray(image_array)
+        if np.issubdtype(image_array.dtype, np.floating):
+            image_array = np.clip(image_array * 255, 0, 255).astype(np.uint8)
+        elif image_array.dtype != np.uint8:
+            image_array = np.clip(image_array, 0, 255).astype(np.uint8)
+        if image_array.ndim == 2:
+            return cv2.cvtColor(image_array, cv2.COLOR_GRAY2RGB)
+        if image_array.ndim == 3 and image_array.shape[2] == 4:
+            return cv2.cvtColor(image_array, cv2.COLOR_RGBA2RGB)
+        if image_array.ndim == 3 and image_array.shape[2] == 3:
+            return np.ascontiguousarray(image_array)
+        return None
+    
     def preprocess_image(self, original_image):
         # denoise, enhance contrast, apply gamma correction, and sharpen
         print("cleaning and enhancing image quality")
         
-        img = original_image.copy()
+        tile_rows = self.preprocess_strip_height(original_image.shape)
+        if tile_rows is not None:
+            img_sharpened = self.preprocess_image_tiled(original_image, tile_rows)
+            self.processed_image = img_sharpened
+            print("preprocessing complete")
+            return img_sharpened
+        
+        # the whole chain stays uint8 and works in one buffer: bilateral output -> lab -> clahe on
+        # the lightness channel -> rgb -> gamma lut, each step writing over the previous one
         
         # denoise while keeping edges sharp
-        img_denoised = cv2.bilateralFilter(img, self.bilateral_d, self.bilateral_sigma_color, self.bilateral_sigma_space)
+        img = cv2.bilateralFilter(original_image, self.bilateral_d, self.bilateral_sigma_color, self.bilateral_sigma_space)
         
         # enhance contrast using CLAHE
-        lab = cv2.cvtColor(img_denoised, cv2.COLOR_RGB2LAB)
-        clahe = cv2.createCLAHE(clipLimit=self.clahe_clip_limit, tileGridSize=self.clahe_tile_grid)
-        lab[:,:,0] = clahe.apply(lab[:,:,0])
-        img_enhanced = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
+        cv2.cvtColor(img, cv2.COLOR_RGB2LAB, dst=img)
+        self.apply_clahe(img)
+        cv2.cvtColor(img, cv2.COLOR_LAB2RGB, dst=img)
         
         # gamma correction for better colony visibility
-        img_gamma = np.power(img_enhanced / 255.0, self.gamma) * 255
-        img_gamma = img_gamma.astype(np.uint8)
+        cv2.LUT(img, self.gamma_lut(), dst=img)
         
         # sharpen image slightly
-        if self.sharpen_strength > 0:
-            kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]]) * self.sharpen_strength
-            img_sharpened = cv2.filter2D(img_gamma, -1, kernel)
-        else:
-            img_sharpened = img_gamma
+        img_sharpened = self.sharpen(img)
         
         self.processed_image = img_sharpened
         print("preprocessing complete")
         return img_sharpened
     
+    def preprocess_strip_height(self, image_shape):
+        # rows per strip for tiled preprocessing, None to process the whole image at once
+        # 'auto' only tiles scans above ~12 MP, smaller plates are faster in one piece
+        tile_rows = self.preprocess_tile_rows
+        if tile_rows == 'auto':
+            h, w = image_shape[:2]
+            tile_rows = 256 if h * w > 12_000_000 else None
+        if tile_rows is None or tile_rows >= image_shape[0]:
+            return None
+        return max(1, int(tile_rows))
+    
+    def preprocess_image_tiled(self, original_image, tile_rows):
+        # same output as the whole-image path, but the bilateral filter, color conversions, gamma and
+        # sharpening run on horizontal strips padded with halo rows, so the float temporaries only
+        # ever cover one strip. CLAHE needs the tile histograms of the whole lightness channel,
+        # so it runs once on that single channel between the two strip passes
+        h = original_image.shape[0]
+        
+        # bilateral filter reads d//2 rows around each pixel (1.5 * sigma_space when d <= 0)
+        if self.bilateral_d > 0:
+            bilateral_halo = self.bilateral_d // 2
+        else:
+            bilateral_halo = int(round(self.bilateral_sigma_space * 1.5))
+        bilateral_halo += 1
+        
+        # opencv switches bilateral implementations (ipp vs its own) for inputs smaller than the
+        # filter window, which round differently, so no strip may be shorter than the window
+        min_rows = 2 * bilateral_halo + 1
+        tile_rows = max(tile_rows, min_rows)
+        strips = [(top, min(top + tile_rows, h)) for top in range(0, h, tile_rows)]
+        if len(strips) > 1 and strips[-1][1] - strips[-1][0] < min_rows:
+            strips[-2:] = [(strips[-2][0], h)]
+        sharpen_halo = 1 if self.sharpen_strength > 0 else 0
+        lut = self.gamma_lut()
+        
+        lab = np.empty_like(original_image)
+        processed = np.empty_like(original_image)
+        
+        def denoise_strip(strip):
+            top, bottom = strip
+            lo, hi = max(0, top - bilateral_halo), min(h, bottom + bilateral_halo)
+            denoised = cv2.bilateralFilter(original_image[lo:hi], self.bilateral_d,
+                                           self.bilateral_sigma_color, self.bilateral_sigma_space)
+            cv2.cvtColor(denoised[top - lo:bottom - lo], cv2.COLOR_RGB2LAB, dst=lab[top:bottom])
+        
+        def enhance_strip(strip):
+            top, bottom = strip
+            lo, hi = max(0, top - sharpen_halo), min(h, bottom + sharpen_halo)
+            img = cv2.cvtColor(lab[lo:hi], cv2.COLOR_LAB2RGB)
+            cv2.LUT(img, lut, dst=img)
+            processed[top:bottom] = self.sharpen(img)[top - lo:bottom - lo]
+        
+        self.map_strips(denoise_strip, strips)
+        self.apply_clahe(lab)
+        self.map_strips(enhance_strip, strips)
+        return processed
+    
+    def gamma_lut(self):
+        # 256-entry uint8 table for the gamma curve, same values as np.power on every pixel
+        levels = np.arange(256, dtype=np.float64) / 255.0
+        return (np.power(levels, self.gamma) * 255).astype(np.uint8)
+    
+    def apply_clahe(self, lab):
+        # CLAHE on the lightness channel of a uint8 lab image, written back in place
+        clahe = cv2.createCLAHE(clipLimit=self.clahe_clip_limit, tileGridSize=self.clahe_tile_grid)
+        lightness = cv2.extractChannel(lab, 0)
+        clahe.apply(lightness, dst=lightness)
+        cv2.insertChannel(lightness, lab, 0)
+    
+    def sharpen(self, img):
+        # 3x3 sharpening kernel scaled by sharpen_strength, returns img untouched when disabled
+        if self.sharpen_strength <= 0:
+            return img
+        kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]]) * self.sharpen_strength
+        return cv2.filter2D(img, -1, kernel)
+    
+    def map_strips(self, func, strips):
+        # run func on every strip, on worker threads when n_jobs > 1 (opencv releases the gil)
+        workers = min(self.worker_count(), len(strips))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(func, strips))
+        else:
+            for strip in strips:
+                func(strip)
+    
     def detect_plate(self, processed_image):
-        # find inner rectangular region of plate and compute metrics
+        # find inner region of plate (margin rectangle, or inner ellipse for round dishes) and compute metrics
         print("detecting inner plate area without edges")
         
-        gray = cv2.cvtColor(processed_image, cv2.COLOR_RGB2GRAY)
-        h, w = gray.shape
-        
-        # create inner margin to exclude plate edges
-        margin_h = int(h * self.margin_percent)
-        margin_w = int(w * self.margin_percent)
-        
-        # create inner rectangular mask
-        inner_mask = np.zeros((h, w), dtype=np.uint8)
-        inner_mask[margin_h:h-margin_h, margin_w:w-margin_w] = 255
-        
-        # refine using intensity analysis
-        masked_gray = cv2.bitwise_and(gray, gray, mask=inner_mask)
-        
-        # find actual plate content area
-        _, thresh = cv2.threshold(masked_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
-        # find largest contour in inner area
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        if contours:
-            largest_contour = max(contours, key=cv2.contourArea)
-            refined_mask = np.zeros((h, w), dtype=np.uint8)
-            cv2.fillPoly(refined_mask, [largest_contour], 255)
-            
-            # combine with inner margin
-            final_mask = cv2.bitwise_and(inner_mask, refined_mask)
+        h, w = processed_image.shape[:2]
+        
+        plate = None
+        if self.plate_shape == 'circle':
+            plate = self.find_circular_plate(cv2.cvtColor(processed_image, cv2.COLOR_RGB2GRAY))
+            if plate is None:
+                print("no circular plate found, falling back to rectangular margin")
+        
+        if plate is not None:
+            # shrink the fitted rim by the margin so the dish wall is excluded like the rectangle edges
+            (cx, cy), (axis_w, axis_h), angle = plate
+            inner_axes = (axis_w * (1 - 2*self.margin_percent), axis_h * (1 - 2*self.margin_percent))
+            inner_mask = np.zeros((h, w), dtype=np.uint8)
+            cv2.ellipse(inner_mask, ((cx, cy), inner_axes, angle), 255, -1)
+            x, y, rect_w, rect_h = cv2.boundingRect(inner_mask)
+            shape_info = {'shape': 'circle', 'center': (int(round(cx)), int(round(cy))),
+                          'axes': inner_axes, 'angle': angle}
         else:
-            final_mask = inner_mask
+            # create inner margin to exclude plate edges
+            margin_h = int(h * self.margin_percent)
+            margin_w = int(w * self.margin_percent)
             
-        # get bounding box info
-        x, y, rect_w, rect_h = margin_w, margin_h, w-2*margin_w, h-2*margin_h
+            # create inner rectangular mask
+            inner_mask = np.zeros((h, w), dtype=np.uint8)
+            inner_mask[margin_h:h-margin_h, margin_w:w-margin_w] = 255
+            x, y, rect_w, rect_h = margin_w, margin_h, w-2*margin_w, h-2*margin_h
+            shape_info = {'shape': 'rect', 'center': (w//2, h//2)}
         
-        plate_info = {
-            'center': (w//2, h//2),
+        # refine using intensity analysis, only inside the inner region's bounding box
+        final_mask = self.refine_plate_mask(processed_image, inner_mask, (x, y, rect_w, rect_h))
+        
+        plate_info = dict(shape_info)
+        plate_info.update({
             'bbox': (x, y, rect_w, rect_h),
-            'area_pixels': rect_w * rect_h,
-            'inner_area': np.sum(final_mask > 0)
-        }
+            'area_pixels': cv2.countNonZero(inner_mask[y:y+rect_h, x:x+rect_w]) if rect_w > 0 and rect_h > 0 else 0,
+            'inner_area': cv2.countNonZero(final_mask)
+        })
         
         self.plate_mask = final_mask
         self.plate_info = plate_info
         
-        print(f"inner plate area: {rect_w}x{rect_h}, excluding {self.margin_percent*100}% edge margin")
+        if plate_info['shape'] == 'circle':
+            print(f"inner circular plate area: {rect_w}x{rect_h}, excluding {self.margin_percent*100}% rim margin")
+        else:
+            print(f"inner plate area: {rect_w}x{rect_h}, excluding {self.margin_percent*100}% edge margin")
         return final_mask, plate_info
     
+    def refine_plate_mask(self, processed_image, inner_mask, bbox):
+        # keep the largest bright otsu region inside inner_mask
+        # everything outside the bbox is masked out, so only the bbox is thresholded and traced;
+        # the otsu histogram still counts the masked-out pixels as 0 like a full-frame threshold would
+        x, y, bw, bh = bbox
+        h, w = inner_mask.shape
+        if bw <= 0 or bh <= 0:
+            return inner_mask
+        
+        crop_mask = inner_mask[y:y+bh, x:x+bw]
+        gray = cv2.cvtColor(processed_image[y:y+bh, x:x+bw], cv2.COLOR_RGB2GRAY)
+        masked_gray = cv2.bitwise_and(gray, gray, mask=crop_mask)
+        
+        # calcHist counts in float32, exact up to 2**24 pixels
+        if masked_gray.size < 2**24:
+            hist = cv2.calcHist([masked_gray], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+        else:
+            hist = np.bincount(masked_gray.ravel(), minlength=256)
+        hist[0] += h * w - masked_gray.size
+        threshold = self.otsu_threshold(hist)
+        _, thresh = cv2.threshold(masked_gray, threshold, 255, cv2.THRESH_BINARY)
+        
+        # find largest contour in inner area (1 px zero border so contours match the full frame)
+        thresh = cv2.copyMakeBorder(thresh, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x-1, y-1))
+        
+        if not contours:
+            return inner_mask
+        
+        largest_contour = max(contours, key=cv2.contourArea)
+        refined_crop = np.zeros((bh, bw), dtype=np.uint8)
+        cv2.fillPoly(refined_crop, [largest_contour], 255, offset=(-x, -y))
+        
+        # combine with inner margin
+        final_mask = np.zeros((h, w), dtype=np.uint8)
+        final_mask[y:y+bh, x:x+bw] = cv2.bitwise_and(crop_mask, refined_crop)
+        return final_mask
+    
+    def otsu_threshold(self, hist):
+        # otsu threshold from a 256-bin histogram, same arithmetic as cv2.THRESH_OTSU on 8-bit images
+        eps = np.finfo(np.float32).eps
+        scale = 1.0 / hist.sum()
+        mu = 0.0
+        for i in range(256):
+            mu += i * float(hist[i])
+        mu *= scale
+        mu1 = q1 = max_sigma = 0.0
+        max_val = 0
+        for i in range(256):
+            p_i = hist[i] * scale
+            mu1 *= q1
+            q1 += p_i
+            q2 = 1.0 - q1
+            if min(q1, q2) < eps or max(q1, q2) > 1.0 - eps:
+                continue
+            mu1 = (mu1 + i * p_i) / q1
+            mu2 = (mu - q1 * mu1) / q2
+            sigma = q1 * q2 * (mu1 - mu2) * (mu1 - mu2)
+            if sigma > max_sigma:
+                max_sigma = sigma
+                max_val = i
+        return max_val
+    
+    def find_circular_plate(self, gray):
+        # coarse-to-fine dish rim: hough circle on a small pyramid level, then the rim is located
+        # at full resolution only along radial rays in a thin band around it and fitted with an ellipse
+        # returns a cv2 rotated rect ((cx, cy), (width, height), angle) or None
+        small = gray
+        scale = 1
+        while max(small.shape) > 512:
+            small = cv2.pyrDown(small)
+            scale *= 2
+        
+        min_side = min(small.shape)
+        circles = cv2.HoughCircles(cv2.medianBlur(small, 5), cv2.HOUGH_GRADIENT, dp=1, minDist=min_side,
+                                   param1=100, param2=30,
+                                   minRadius=int(min_side * 0.3), maxRadius=int(min_side * 0.55))
+        if circles is None:
+            return None
+        # pyrDown keeps pixel i of a level at pixel 2*i of the level below
+        cx, cy, radius = circles[0, 0] * scale
+        
+        # sample intensity profiles along 360 rays crossing the coarse rim
+        band = max(2 * scale, int(0.04 * radius))
+        angles = np.linspace(0, 2*np.pi, 360, endpoint=False)
+        radii = np.arange(radius - band, radius + band + 1, dtype=np.float32)
+        map_x = (cx + np.outer(np.cos(angles), radii)).astype(np.float32)
+        map_y = (cy + np.outer(np.sin(angles), radii)).astype(np.float32)
+        h, w = gray.shape
+        inside = ((map_x >= 0) & (map_x <= w-1) & (map_y >= 0) & (map_y <= h-1)).all(axis=1)
+        if inside.sum() < 5:
+            return None
+        profiles = cv2.remap(gray, map_x, map_y, cv2.INTER_LINEAR).astype(np.float32)
+        profiles = cv2.GaussianBlur(profiles, (1, 5), 0)
+        
+        # the rim is the strongest radial intensity change on each ray
+        edge_index = np.argmax(np.abs(np.diff(profiles, axis=1)), axis=1)
+        edge_radius = radii[edge_index] + 0.5
+        
+        # drop rays that locked onto a colony or a label instead of the rim
+        keep = inside & (np.abs(edge_radius - np.median(edge_radius[inside])) < band / 2)
+        if keep.sum() < 5:
+            return None
+        points = np.stack([cx + np.cos(angles[keep]) * edge_radius[keep],
+                           cy + np.sin(angles[keep]) * edge_radius[keep]], axis=1).astype(np.float32)
+        return cv2.fitEllipse(points)
+    
     def segment_colonies(self, processed_image, plate_mask):
         # identify each bacterial colony as separate blob within dish boundary
-        print("segmenting colonies in rectangular plate")
-        
-        # apply rectangular plate mask first
+        is_circle = self.plate_info is not None and self.plate_info.get('shape') == 'circle'
+        plate_kind = "circular" if is_circle else "rectangular"
+        print(f"segmenting colonies in {plate_kind} plate")
+        
+        # everything outside the plate mask is blanked, so only its bounding box (plus a halo wider than
+        # the threshold block and morphology kernels) is segmented; the dish rim never gets processed
+        full_shape = plate_mask.shape
+        x, y, bw, bh = cv2.boundingRect(plate_mask)
+        halo = self.adaptive_block_size // 2 + self.min_distance + 4
+        top, left = max(0, y - halo), max(0, x - halo)
+        bottom, right = min(full_shape[0], y + bh + halo), min(full_shape[1], x + bw + halo)
+        processed_image = processed_image[top:bottom, left:right]
+        plate_mask = plate_mask[top:bottom, left:right]
+        
+        # apply plate mask first
         masked_img = cv2.bitwise_and(processed_image, processed_image, mask=plate_mask)
         
         gray = cv2.cvtColor(masked_img, cv2.COLOR_RGB2GRAY)
@@ -200,41 +523,106 @@ class ColonyAnalyzer:
         
         if self.watershed and len(coords) > 0:
             markers = np.zeros_like(binary_clean, dtype=np.int32)
-            for i, coord in enumerate(coords):
-                markers[coord[0], coord[1]] = i + 1
+            markers[coords[:, 0], coords[:, 1]] = np.arange(1, len(coords) + 1)
             labels = segmentation.watershed(-distance, markers, mask=binary_clean)
         else:
             num_labels, labels = cv2.connectedComponents(binary_clean)
         
+        # back to full-frame coordinates so colony properties and label images match the original image
+        full_labels = np.zeros(full_shape, dtype=labels.dtype)
+        full_labels[top:bottom, left:right] = labels
+        labels = full_labels
+        
         # filter by size
         min_colony_size = self.min_colony_size
         max_colony_size = self.max_colony_size
-        colony_props = measure.regionprops(labels)
+        # one bincount gives every region's area; regions are renumbered 1..n in label order
+        # (same ids as enumerating regionprops) and dropped ones map to 0 in a single lut remap
+        areas = np.bincount(labels.ravel())
+        present = np.flatnonzero(areas[1:]) + 1
+        keep = (areas[present] >= min_colony_size) & (areas[present] <= max_colony_size)
         
-        valid_colonies = []
-        valid_label_mask = np.zeros_like(labels)
-        
-        for new_id, prop in enumerate(colony_props, start=1):
-            if min_colony_size <= prop.area <= max_colony_size:
-                valid_colonies.append(prop)
-                valid_label_mask[labels == prop.label] = new_id
+        lut = np.zeros(len(areas), dtype=labels.dtype)
+        lut[present[keep]] = np.flatnonzero(keep) + 1
+        valid_label_mask = lut[labels]
+        valid_colonies = ColonyTable.from_label_image(valid_label_mask)
         
         self.colony_labels = valid_label_mask
         self.colony_properties = valid_colonies
         self.final_binary_mask = (valid_label_mask > 0).astype(np.uint8) * 255
+        self.colony_distance_map = self.colony_distance_transform(valid_label_mask)
         
-        print(f"found {len(valid_colonies)} colonies in rectangular plate")
+        print(f"found {len(valid_colonies)} colonies in {plate_kind} plate")
         return valid_label_mask, valid_colonies
     
+    def colony_distance_transform(self, colony_labels):
+        # distance from every colony pixel to the nearest pixel outside its own colony
+        # one edt over the whole foreground is exact for colonies that only border background,
+        # colonies touching another label get their own edt on their bbox grown by one pixel
+        # (that ring is outside the colony and at least as close as anything beyond the crop)
+        # a single pass with the seams cut out comes out a pixel short inside touching colonies, and the
+        # bbox edts together cost far less than the full-frame one, so exactness wins over one pass
+        foreground = colony_labels > 0
+        distance_map = ndimage.distance_transform_edt(foreground).astype(np.float32)
+
+        touching_labels = set()
+        for a, b in ((colony_labels[:-1, :], colony_labels[1:, :]),
+                     (colony_labels[:, :-1], colony_labels[:, 1:])):
+            touching = (a != b) & (a > 0) & (b > 0)
+            touching_labels.update(np.unique(a[touching]).tolist())
+            touching_labels.update(np.unique(b[touching]).tolist())
+        if not touching_labels:
+            return distance_map
+
+        height, width = colony_labels.shape
+        slices = ndimage.find_objects(colony_labels)
+        for label in touching_labels:
+            rows, cols = slices[label - 1]
+            crop = (slice(max(rows.start - 1, 0), min(rows.stop + 1, height)),
+                    slice(max(cols.start - 1, 0), min(cols.stop + 1, width)))
+            mask = colony_labels[crop] == label
+            distance_map[crop][mask] = ndimage.distance_transform_edt(mask)[mask]
+        return distance_map
+
+    def worker_count(self):
+        # n_jobs=None or < 1 means one worker per cpu
+        if self.n_jobs is None or self.n_jobs < 1:
+            return os.cpu_count() or 1
+        return self.n_jobs
+
+    def map_colony_chunks(self, func, colony_properties, *args):
+        # split colonies into contiguous chunks, one per worker thread
+        # func(chunk, start, total, *args) returns a list of records, concatenated back in colony order
+        total = len(colony_properties)
+        n_chunks = min(max(self.worker_count() // self.concurrent_stages, 1), total)
+        if n_chunks <= 1:
+            return func(colony_properties, 0, total, *args)
+
+        bounds = np.linspace(0, total, n_chunks + 1).astype(int)
+        with ThreadPoolExecutor(max_workers=n_chunks) as pool:
+            futures = [pool.submit(func, colony_properties[a:b], a, total, *args)
+                       for a, b in zip(bounds[:-1], bounds[1:])]
+            records = []
+            for future in futures:
+                records.extend(future.result())
+        return records
+
     def analyze_morphology(self, colony_labels, colony_properties):
         # measure each colony's shape and classify edge style
         print(f"analyzing morphology for {len(colony_properties)} colonies...")
-        
+
+        data = self.map_colony_chunks(self.morphology_records, colony_properties, colony_labels)
+
+        self.morph_df = pd.DataFrame(data)
+        return self.morph_df
+
+    def morphology_records(self, colony_properties, start, total, colony_labels):
+        # shape measurements for one contiguous chunk of colonies, ids continue from start
         data = []
-        for idx, prop in enumerate(colony_properties):
+        for idx, prop in enumerate(colony_properties, start=start):
             if idx % 10 == 0 and idx > 0:
-                print(f"processed {idx}/{len(colony_properties)} colonies")
-            
+                print(f"processed {idx}/{total} colonies")
+
             area = prop.area
             perimeter = prop.perimeter
             major_axis = prop.major_axis_length
@@ -244,9 +632,8 @@ class ColonyAnalyzer:
             solidity = prop.solidity
             extent = prop.extent
             
-            mask = (colony_labels == prop.label).astype('uint8')
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
+            contours = self.colony_contours(colony_labels, prop)
+
             if contours:
                 cnt = max(contours, key=cv2.contourArea)
                 hull = cv2.convexHull(cnt)
@@ -291,10 +678,19 @@ class ColonyAnalyzer:
                 'form': form,
                 'margin': margin
             })
-        
-        self.morph_df = pd.DataFrame(data)
-        return self.morph_df
-    
+        return data
+
+    def colony_contours(self, colony_labels, prop):
+        # outer contours of one colony traced inside its bounding box only
+        # a 1 pixel zero border keeps edge-touching colonies closed exactly like the full frame,
+        # and the offset puts contour points back into full image coordinates
+        minr, minc, maxr, maxc = prop.bbox
+        mask = (colony_labels[minr:maxr, minc:maxc] == prop.label).astype('uint8')
+        mask = cv2.copyMakeBorder(mask, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE,
+                                       offset=(minc - 1, minr - 1))
+        return contours
+
     def extract_dominant_colors(self, colony_pixels, n_colors=3):
         # get dominant colors instead of mean
         if len(colony_pixels) < 10:
@@ -311,22 +707,67 @@ class ColonyAnalyzer:
         dominant_label = label_counts.most_common(1)[0][0]
         
         return kmeans.cluster_centers_[dominant_label]
-    
+
+    def group_colony_pixels(self, image, colony_labels):
+        # gather every colony's pixels with one stable sort over the foreground
+        # pixels of a colony stay in raster order, same as image[colony_labels == label]
+        flat_labels = colony_labels.ravel()
+        foreground = np.flatnonzero(flat_labels)
+        order = foreground[np.argsort(flat_labels[foreground], kind='stable')]
+        sorted_labels = flat_labels[order]
+        pixels = image.reshape(-1, image.shape[-1])[order]
+        return sorted_labels, pixels
+
+    def extract_dominant_colors_batch(self, sorted_labels, pixels, labels, n_colors=3, n_iter=10):
+        # fixed-iteration kmeans run for all colonies at once
+        # centers start at mean - std, mean, mean + std of each colony so the result is deterministic
+        n = len(labels)
+        label_to_row = np.full(int(max(sorted_labels.max(initial=0), np.max(labels))) + 1, -1)
+        label_to_row[labels] = np.arange(n)
+        rows = label_to_row[sorted_labels]
+        keep = rows >= 0
+        rows = rows[keep]
+        x = pixels[keep].astype(np.float64)
+
+        counts = np.bincount(rows, minlength=n)
+        safe_counts = np.maximum(counts, 1)[:, None]
+        mean = np.stack([np.bincount(rows, weights=x[:, ch], minlength=n) for ch in range(3)], axis=1) / safe_counts
+        mean_sq = np.stack([np.bincount(rows, weights=x[:, ch] ** 2, minlength=n) for ch in range(3)], axis=1) / safe_counts
+        std = np.sqrt(np.maximum(mean_sq - mean ** 2, 0))
+
+        offsets = np.linspace(-1, 1, n_colors)
+        centers = mean[:, None, :] + offsets[None, :, None] * std[:, None, :]
+
+        dist = np.empty((len(x), n_colors))
+        for iteration in range(n_iter + 1):
+            # one center at a time keeps temporaries at (pixels, 3)
+            for j in range(n_colors):
+                dist[:, j] = ((x - centers[rows, j]) ** 2).sum(axis=1)
+            key = rows * n_colors + dist.argmin(axis=1)
+            member_counts = np.bincount(key, minlength=n * n_colors).reshape(n, n_colors)
+            if iteration == n_iter:
+                break
+            sums = np.stack([np.bincount(key, weights=x[:, ch], minlength=n * n_colors) for ch in range(3)], axis=-1)
+            sums = sums.reshape(n, n_colors, 3)
+            centers = np.where(member_counts[..., None] > 0,
+                               sums / np.maximum(member_counts, 1)[..., None], centers)
+
+        dominant = centers[np.arange(n), member_counts.argmax(axis=1)]
+
+        # small colonies use their mean color, like extract_dominant_colors
+        small = counts < 10
+        dominant[small] = mean[small]
+        return dominant, counts
+
     def rgb_to_lab_batch(self, rgb_colors):
         # convert rgb to lab color space
-        rgb_normalized = rgb_colors / 255.0
-        lab_colors = []
-        
-        for rgb in rgb_normalized:
-            rgb_img = rgb.reshape(1, 1, 3)
-            lab_img = color.rgb2lab(rgb_img)
-            lab_colors.append(lab_img[0, 0])
-        
-        return np.array(lab_colors)
+        return rgb_to_lab_batch(rgb_colors)
     
     def analyze_colors(self, processed_image, colony_labels, colony_properties):
         # pick dominant color of each colony and group similar ones
         print(f"analyzing colors and clustering for {len(colony_properties)} colonies...")
+        self.color_inertia_curve = self.inertia_curve([], [], None)
+        self.colony_lab_colors = np.empty((0, 3))
         
         if len(colony_properties) == 0:
             return [], []
@@ -335,22 +776,32 @@ class ColonyAnalyzer:
         rgb_colors = []
         
         print("extracting dominant colors from each colony...")
+        sorted_labels, pixels = self.group_colony_pixels(processed_image, colony_labels)
+        labels = colony_properties.label
+        starts = np.searchsorted(sorted_labels, labels, side='left')
+        ends = np.searchsorted(sorted_labels, labels, side='right')
+
+        if self.dominant_color_method == 'kmeans':
+            batch_colors = None
+        else:
+            batch_colors, _ = self.extract_dominant_colors_batch(sorted_labels, pixels, labels)
+
         # extract dominant colors
-        for i, prop in enumerate(colony_properties):
-            if i % 20 == 0 and i > 0:
+        for i in range(len(colony_properties)):
+            if i % 20 == 0 and i > 0 and batch_colors is None:
                 print(f"extracted colors for {i}/{len(colony_properties)} colonies")
-            
-            mask = (colony_labels == prop.label)
-            colony_pixels = processed_image[mask]
-            
-            if len(colony_pixels) > 0:
-                dominant_rgb = self.extract_dominant_colors(colony_pixels)
-                
+
+            if ends[i] > starts[i]:
+                if batch_colors is None:
+                    dominant_rgb = self.extract_dominant_colors(pixels[starts[i]:ends[i]])
+                else:
+                    dominant_rgb = batch_colors[i]
+
                 colony_info = {
                     'colony_id': i,
-                    'label': prop.label,
-                    'area': prop.area,
-                    'centroid': prop.centroid,
+                    'label': int(labels[i]),
+                    'area': colony_properties.area[i],
+                    'centroid': tuple(colony_properties.centroid[i]),
                     'dominant_color': dominant_rgb
                 }
                 
@@ -363,35 +814,23 @@ class ColonyAnalyzer:
         
         rgb_colors = np.array(rgb_colors)
         lab_colors = self.rgb_to_lab_batch(rgb_colors)
+        self.colony_lab_colors = lab_colors
         
         print(f"extracted colors from {len(colony_data)} colonies")
         
+        if self.color_palette is not None and self.color_palette.fitted:
+            # shared palette: nearest palette color, ids are comparable across plates
+            print("assigning colonies to the global color palette...")
+            clusters = self.color_palette.assign(lab_colors)
+            best_k = self.color_palette.n_clusters
         # find optimal number of clusters using elbow method
-        if len(lab_colors) > 1:
+        elif len(lab_colors) > 1:
             from sklearn.preprocessing import StandardScaler
             scaler = StandardScaler()
             lab_scaled = scaler.fit_transform(lab_colors)
             
             print("determining optimal number of color clusters...")
-            best_k = 3
-            if len(lab_colors) > 4:
-                inertias = []
-                k_range = range(2, min(8, len(lab_colors)))
-                
-                for k in k_range:
-                    kmeans = KMeans(n_clusters=k, random_state=self.color_random_state, n_init=self.color_n_init)
-                    kmeans.fit(lab_scaled)
-                    inertias.append(kmeans.inertia_)
-                
-                # find elbow point
-                if len(inertias) > 2:
-                    diffs = np.diff(inertias)
-                    best_k = k_range[np.argmax(diffs)] if len(diffs) > 0 else 3
-            
-            print(f"performing kmeans clustering with {best_k} clusters...")
-            # final clustering
-            kmeans = KMeans(n_clusters=best_k, random_state=self.color_random_state, n_init=self.color_n_init)
-            clusters = kmeans.fit_predict(lab_scaled)
+            best_k, clusters, self.color_inertia_curve = self.search_color_clusters(lab_scaled)
             
             print(f"kmeans found {best_k} color groups")
         else:
@@ -405,9 +844,71 @@ class ColonyAnalyzer:
         self.colony_data = colony_data
         return colony_data, clusters
     
-    def analyze_density(self, processed_image, colony_labels, colony_properties, plate_mask):
+    def search_color_clusters(self, lab_scaled):
+        # elbow search over k = 2..7, returns (best_k, cluster labels, inertia curve)
+        # the model fitted for the chosen k during the search is reused instead of fitted again
+        # 'warm' / 'minibatch' fit each k once, seeded with the previous k's centers plus the colony
+        # farthest from them, instead of color_n_init random restarts per k
+        search_data = lab_scaled
+        if self.color_search_samples and len(lab_scaled) > self.color_search_samples:
+            rng = np.random.default_rng(self.color_random_state)
+            sample = np.sort(rng.choice(len(lab_scaled), self.color_search_samples, replace=False))
+            search_data = lab_scaled[sample]
+        
+        best_k = 3
+        k_range = []
+        inertias = []
+        models = {}
+        if len(lab_scaled) > 4:
+            k_range = range(2, min(8, len(lab_scaled)))
+            model_type = MiniBatchKMeans if self.color_k_search == 'minibatch' else KMeans
+            centers = None
+            for k in k_range:
+                if self.color_k_search == 'full' or centers is None:
+                    kmeans = model_type(n_clusters=k, random_state=self.color_random_state, n_init=self.color_n_init)
+                else:
+                    # previous centers plus the colony worst served by them
+                    distances = ((search_data[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+                    init = np.vstack([centers, search_data[np.argmax(distances)]])
+                    kmeans = model_type(n_clusters=k, init=init, random_state=self.color_random_state, n_init=1)
+                kmeans.fit(search_data)
+                centers = kmeans.cluster_centers_
+                inertias.append(kmeans.inertia_)
+                models[k] = kmeans
+            
+            # find elbow point
+            if len(inertias) > 2:
+                diffs = np.diff(inertias)
+                best_k = k_range[np.argmax(diffs)] if len(diffs) > 0 else 3
+        
+        print(f"performing kmeans clustering with {best_k} clusters...")
+        model = models.get(best_k)
+        if model is not None and type(model) is KMeans and search_data is lab_scaled:
+            clusters = model.labels_
+        elif model is not None:
+            # the search ran on a sample or with mini-batches, one full pass from its centers
+            clusters = KMeans(n_clusters=best_k, init=model.cluster_centers_, random_state=self.color_random_state,
+                              n_init=1).fit_predict(lab_scaled)
+        else:
+            clusters = KMeans(n_clusters=best_k, random_state=self.color_random_state,
+                              n_init=self.color_n_init).fit_predict(lab_scaled)
+        return best_k, clusters, self.inertia_curve(list(k_range), inertias, best_k)
+    
+    def inertia_curve(self, k_values, inertias, best_k):
+        # elbow search audit table, one row per k tried
+        return pd.DataFrame({
+            'k': pd.Series(k_values, dtype=int),
+            'inertia': pd.Series(inertias, dtype=float),
+            'selected': pd.Series([k == best_k for k in k_values], dtype=bool),
+        })
+    
+    def analyze_density(self, processed_image, colony_labels, colony_properties, plate_mask, distance_map=None):
         # look at pixel density patterns and opacity
         print(f"analyzing density patterns for {len(colony_properties)} colonies...")
+
+        # center/edge rings are read from the label-aware distance map built during segmentation
+        if distance_map is None:
+            distance_map = self.colony_distance_transform(colony_labels)
         
         gray_image = cv2.cvtColor(processed_image, cv2.COLOR_RGB2GRAY)
         hsv_image = cv2.cvtColor(processed_image, cv2.COLOR_RGB2HSV)
@@ -418,16 +919,26 @@ class ColonyAnalyzer:
         background_mean = np.mean(background_pixels) if len(background_pixels) > 0 else 128
         background_std = np.std(background_pixels) if len(background_pixels) > 0 else 30
         
+        colony_density_data = self.map_colony_chunks(
+            self.density_records, colony_properties, colony_labels, gray_image, hsv_image,
+            distance_map, background_mean, background_std)
+
+        self.density_df = pd.DataFrame(colony_density_data)
+        print("done with density analysis")
+        return self.density_df
+
+    def density_records(self, colony_properties, start, total, colony_labels, gray_image, hsv_image,
+                        distance_map, background_mean, background_std):
+        # density measurements for one contiguous chunk of colonies, ids continue from start
         colony_density_data = []
-        
-        for i, prop in enumerate(colony_properties):
+        columns = zip(colony_properties.label, colony_properties.area, colony_properties.bbox)
+        for i, (label, area, (minr, minc, maxr, maxc)) in enumerate(columns, start=start):
             if i % 15 == 0 and i > 0:
-                print(f"analyzed density for {i}/{len(colony_properties)} colonies")
+                print(f"analyzed density for {i}/{total} colonies")
             
-            minr, minc, maxr, maxc = prop.bbox
             colony_region_gray = gray_image[minr:maxr, minc:maxc]
             colony_region_hsv = hsv_image[minr:maxr, minc:maxc]
-            colony_mask_region = (colony_labels[minr:maxr, minc:maxc] == prop.label)
+            colony_mask_region = (colony_labels[minr:maxr, minc:maxc] == label)
             
             if not np.any(colony_mask_region):
                 continue
@@ -440,7 +951,7 @@ class ColonyAnalyzer:
             opacity_score = abs(mean_intensity - background_mean) / background_std
             density_uniformity = 1.0 / (std_intensity + 1)
             
-            distance_transform = ndimage.distance_transform_edt(colony_mask_region)
+            distance_transform = np.where(colony_mask_region, distance_map[minr:maxr, minc:maxc], 0)
             max_distance = np.max(distance_transform)
             
             if max_distance > 3:
@@ -455,11 +966,11 @@ class ColonyAnalyzer:
                 center_density = edge_density = mean_intensity
                 density_gradient = 0
             
-            kernel_size = max(3, min(7, int(np.sqrt(prop.area) // 3)))
+            kernel_size = max(3, min(7, int(np.sqrt(area) // 3)))
             if kernel_size % 2 == 0:
                 kernel_size += 1
             
-            local_var = ndimage.generic_filter(colony_region_gray.astype(float), np.var, size=kernel_size)
+            local_var = self.local_variance(colony_region_gray, kernel_size)
             texture_score = np.mean(local_var[colony_mask_region])
             mean_saturation = np.mean(colony_pixels_hsv[:, 1])
             
@@ -476,7 +987,7 @@ class ColonyAnalyzer:
             
             colony_info = {
                 'colony_id': i,
-                'area': prop.area,
+                'area': area,
                 'mean_intensity': mean_intensity,
                 'opacity_score': opacity_score,
                 'density_uniformity': density_uniformity,
@@ -487,11 +998,16 @@ class ColonyAnalyzer:
             }
             
             colony_density_data.append(colony_info)
-        
-        self.density_df = pd.DataFrame(colony_density_data)
-        print("done with density analysis")
-        return self.density_df
+        return colony_density_data
     
+    def local_variance(self, image, kernel_size):
+        # variance over a kernel_size window as E[x^2] - E[x]^2 from two box filters
+        # reflect borders match ndimage.generic_filter(image, np.var, size=kernel_size)
+        img = image.astype(np.float64)
+        mean = ndimage.uniform_filter(img, size=kernel_size, mode='reflect')
+        mean_sq = ndimage.uniform_filter(img * img, size=kernel_size, mode='reflect')
+        return np.maximum(mean_sq - mean * mean, 0)
+
     def combine_analyses(self, morph_df, colony_data, density_df, scores_df=None):
         # combine morphology, color, density data and calculate comprehensive scores
         print("combining morphology, color, and density analysis results...")
@@ -536,6 +1052,18 @@ class ColonyAnalyzer:
         print(f"successfully combined analysis data for {len(combined_df)} colonies")
         return combined_df
     
+    def category_frequency(self, *columns):
+        # share of rows with the same value (or the same tuple of values across columns), per row
+        # same numbers as value_counts(normalize=True) looked up row by row, via codes and take
+        codes = None
+        for column in columns:
+            column_codes, uniques = pd.factorize(column, use_na_sentinel=False)
+            codes = column_codes if codes is None else codes * len(uniques) + column_codes
+        if len(columns) > 1:
+            codes, _ = pd.factorize(codes)
+        counts = np.bincount(codes)
+        return (counts / len(codes)).take(codes)
+    
     def calculate_scores(self, combined_df):
         # compute base scores penalizing common features and rewarding rare combos
         print("calculating comprehensive scoring metrics for each colony...")
@@ -552,8 +1080,8 @@ class ColonyAnalyzer:
         
         # form rarity score
         if 'form' in combined_df:
-            freq_f = combined_df['form'].value_counts(normalize=True)
-            scores['form_score'] = combined_df['form'].map(lambda x: (1-freq_f[x])**0.8)
+            freq_form = self.category_frequency(combined_df['form'])
+            scores['form_score'] = (1-freq_form)**0.8
         else:
             scores['form_score'] = 0.5
         
@@ -590,7 +1118,7 @@ class ColonyAnalyzer:
         # margin preference
         if 'margin' in combined_df:
             interest = {'entire':0.2,'undulate':0.6,'serrate':1.0,'lobate':0.8,'unknown':0.5}
-            scores['margin_score'] = combined_df['margin'].map(lambda x: interest.get(x,0.5))
+            scores['margin_score'] = combined_df['margin'].map(interest).fillna(0.5).astype(float)
         else:
             scores['margin_score'] = 0.5
         
@@ -605,24 +1133,22 @@ class ColonyAnalyzer:
         scores['bio_base'] = sum(scores[f]*w for f,w in weights.items())
         
         # combo novelty reward
-        combo = None
+        # a (color_cluster, form) pair is one category, no string concatenation needed
+        freq_combo = None
         if 'color_cluster' in combined_df and 'form' in combined_df:
-            combo = combined_df['color_cluster'].astype(str)+'_'+combined_df['form'].astype(str)
-            freq_combo = combo.value_counts(normalize=True)
-            scores['novelty_combo'] = combo.map(lambda x: (1-freq_combo[x])*0.3 if freq_combo[x]<0.03 else 0)
+            freq_combo = self.category_frequency(combined_df['color_cluster'], combined_df['form'])
+            scores['novelty_combo'] = np.where(freq_combo<0.03, (1-freq_combo)*0.3, 0)
         else:
             scores['novelty_combo'] = 0
         
         # penalties on common features
         pen_vals = np.zeros(len(combined_df))
         if 'color_cluster' in combined_df:
-            freq_c = combined_df['color_cluster'].value_counts(normalize=True)
-            pen_vals += combined_df['color_cluster'].map(lambda x: freq_c[x]**2)
+            pen_vals += self.category_frequency(combined_df['color_cluster'])**2
         if 'form' in combined_df:
-            freq_f = combined_df['form'].value_counts(normalize=True)
-            pen_vals += combined_df['form'].map(lambda x: freq_f[x]**2)
-        if combo is not None:
-            pen_vals += combo.map(lambda x: freq_combo[x]**2)
+            pen_vals += freq_form**2
+        if freq_combo is not None:
+            pen_vals += freq_combo**2
         scores['penalty'] = (pen_vals/3) * 0.7
         
         # final interest score
@@ -642,100 +1168,169 @@ class ColonyAnalyzer:
     
     def select_top_colonies(self, scores_df, n=20, penalty_factor=0.5):
         # pick top scoring colonies while enforcing minimum per-cluster quota
-        selected = []
-        pool = scores_df.copy().set_index('colony_id')
-        
-        # determine quotas per unique color cluster
-        clusters = pool['color_cluster'].unique() if 'color_cluster' in pool else []
-        k = len(clusters)
-        min_quota = n // k if k>0 else 0
-        quota = {c:0 for c in clusters}
-        
-        for _ in range(n):
-            if pool.empty:
-                break
-            # enforce quota: select from clusters under quota first
-            under = [c for c,count in quota.items() if count < min_quota]
-            if under:
-                cand = pool[pool['color_cluster'].isin(under)]
-            else:
-                cand = pool
-            # pick best candidate (use deterministic sorting for ties)
-            best_candidates = cand[cand['bio_interest'] == cand['bio_interest'].max()]
-            if len(best_candidates) > 1:
-                # Sort by colony_id for deterministic selection
-                best = best_candidates.sort_values('colony_id').iloc[0].name
-            else:
-                best = cand['bio_interest'].idxmax()
-            selected.append(best)
-            # update quota
-            if 'color_cluster' in pool:
-                c = pool.loc[best,'color_cluster']
-                quota[c] = quota.get(c,0) + 1
-            # penalize same cluster/form in pool
-            attrs = ['color_cluster','form']
-            row = pool.loc[best]
-            for attr in attrs:
-                if attr in row:
-                    mask = pool[attr]==row[attr]
-                    pool.loc[mask,'bio_interest'] *= (1-penalty_factor)
-            # remove picked
-            pool = pool.drop(best)
-        
+        # each pick penalizes the remaining colonies of the same cluster/form (see diverse_selection.py),
+        # ties go to the lowest colony_id
+        columns = {attr: scores_df[attr].to_numpy() if attr in scores_df else None
+                   for attr in ['color_cluster', 'form']}
+        colony_ids = scores_df['colony_id'].to_numpy()
+        picks = select_diverse_indices(scores_df['bio_interest'].to_numpy(), columns['color_cluster'],
+                                       columns['form'], n=n, penalty_factor=penalty_factor, tie_order=colony_ids)
+        selected = colony_ids[picks].tolist()
         self.top_colonies = scores_df.set_index('colony_id').loc[selected].reset_index()
         return self.top_colonies
     
-    def run_full_analysis(self, image_path):
+    def run_full_analysis(self, image_source):
         # run complete analysis pipeline
+        # image_source is anything load_image accepts: a path, encoded bytes / upload buffer, or an rgb array
+        # calling it again on the same analyzer only re-runs the stages whose parameters changed (see set_params)
+        # per-stage wall / cpu time and memory are returned as 'stage_timings' (and appended to trace_path)
         print("starting full colony analysis pipeline")
         
-        # load and preprocess
-        print("loading image and preprocessing...")
-        original = self.load_image(image_path)
-        if original is None:
-            print("failed to load image")
-            return None
-        print(f"image loaded successfully - dimensions: {original.shape[1]}x{original.shape[0]}")
-        
-        processed = self.preprocess_image(original)
-        print("image preprocessing completed")
-        
-        # detect plate and segment colonies
-        print("detecting petri dish plate boundaries...")
-        plate_mask, plate_info = self.detect_plate(processed)
-        print("plate detection completed")
-        
-        print("segmenting bacterial colonies...")
-        colony_labels, colony_props = self.segment_colonies(processed, plate_mask)
-        
-        if len(colony_props) == 0:
-            print("no colonies detected - analysis cannot proceed")
-            return None
-        
-        print(f"found {len(colony_props)} potential colonies for analysis")
-        
-        # analyze colonies
-        print("analyzing colony morphology (shape, size, texture)...")
-        morph_df = self.analyze_morphology(colony_labels, colony_props)
-        
-        print("analyzing colony colors and clustering...")
-        colony_data, clusters = self.analyze_colors(processed, colony_labels, colony_props)
-        
-        print("analyzing colony density patterns...")
-        density_df = self.analyze_density(processed, colony_labels, colony_props, plate_mask)
-        
-        # combine and score
-        print("combining initial analysis results...")
-        combined_df = self.combine_analyses(morph_df, colony_data, density_df)
-        
-        print("calculating colony scores and rankings...")
-        scores_df = self.calculate_scores(combined_df)
-        
-        print("merging scores back into combined dataset...")
-        combined_df = self.combine_analyses(morph_df, colony_data, density_df, scores_df)
-        
-        print(f"selecting top {self.n_top_colonies} colonies...")
-        top_colonies = self.select_top_colonies(scores_df, n=self.n_top_colonies)
+        if not hasattr(image_source, 'getbuffer') and hasattr(image_source, 'read'):
+            # read a plain stream once so hashing and decoding see the same bytes
+            image_source = image_source.read()
+        image_key = image_content_hash(image_source)
+        fingerprints = self.stage_fingerprints_for(image_key)
+        self.last_run_stages = []
+        profiler = StageProfiler(trace_memory=self.profile_memory)
+        
+        def cached(stage):
+            if self.stage_fingerprints.get(stage) == fingerprints[stage]:
+                print(f"reusing cached {stage} stage")
+                profiler.cached(stage)
+                return True
+            return False
+        
+        def store(stage, outputs):
+            self.stage_fingerprints[stage] = fingerprints[stage]
+            self.stage_outputs[stage] = outputs
+            self.last_run_stages.append(stage)
+            return outputs
+        
+        def profiled(stage, func):
+            def run(*args):
+                with profiler.stage(stage):
+                    return func(*args)
+            return run
+        
+        with profiler:
+            # load and preprocess
+            print("loading image and preprocessing...")
+            if cached('load'):
+                original = self.stage_outputs['load']
+                self.original_image = original
+            else:
+                with profiler.stage('load') as record:
+                    original = self.load_image(image_source)
+                    if original is not None:
+                        record['image_size'] = f"{original.shape[1]}x{original.shape[0]}"
+                if original is None:
+                    print("failed to load image")
+                    self.stage_fingerprints.clear()
+                    return None
+                store('load', original)
+            print(f"image loaded successfully - dimensions: {original.shape[1]}x{original.shape[0]}")
+            
+            if cached('preprocess'):
+                processed = self.stage_outputs['preprocess']
+                self.processed_image = processed
+            else:
+                with profiler.stage('preprocess'):
+                    processed = store('preprocess', self.preprocess_image(original))
+            print("image preprocessing completed")
+            
+            # detect plate and segment colonies
+            print("detecting petri dish plate boundaries...")
+            if cached('plate'):
+                plate_mask, plate_info = self.stage_outputs['plate']
+                self.plate_mask, self.plate_info = plate_mask, plate_info
+            else:
+                with profiler.stage('plate'):
+                    plate_mask, plate_info = store('plate', self.detect_plate(processed))
+            print("plate detection completed")
+            
+            print("segmenting bacterial colonies...")
+            if cached('segment'):
+                colony_labels, colony_props, self.colony_distance_map, self.final_binary_mask = self.stage_outputs['segment']
+                self.colony_labels, self.colony_properties = colony_labels, colony_props
+            else:
+                with profiler.stage('segment') as record:
+                    colony_labels, colony_props = self.segment_colonies(processed, plate_mask)
+                    record['n_colonies'] = len(colony_props)
+                store('segment', (colony_labels, colony_props, self.colony_distance_map, self.final_binary_mask))
+            
+            if len(colony_props) == 0:
+                print("no colonies detected - analysis cannot proceed")
+                return None
+            
+            print(f"found {len(colony_props)} potential colonies for analysis")
+            
+            # analyze colonies
+            # the three stages only read the segmentation, so with n_jobs > 1 they run side by side
+            # and split the workers between them instead of each opening n_jobs threads
+            print("analyzing colony morphology (shape, size, texture)...")
+            print("analyzing colony colors and clustering...")
+            print("analyzing colony density patterns...")
+            stages = [
+                ('morphology', self.analyze_morphology, (colony_labels, colony_props)),
+                ('colors', self.analyze_colors, (processed, colony_labels, colony_props)),
+                ('density', self.analyze_density, (processed, colony_labels, colony_props, plate_mask, self.colony_distance_map)),
+            ]
+            stages = [(stage, profiled(stage, func), args) for stage, func, args in stages if not cached(stage)]
+            if self.worker_count() > 1 and len(stages) > 1:
+                self.concurrent_stages = min(self.worker_count(), len(stages))
+                try:
+                    with ThreadPoolExecutor(max_workers=self.concurrent_stages) as pool:
+                        futures = [pool.submit(func, *args) for _, func, args in stages]
+                        stage_results = [future.result() for future in futures]
+                finally:
+                    self.concurrent_stages = 1
+            else:
+                stage_results = [func(*args) for _, func, args in stages]
+            for (stage, _, _), outputs in zip(stages, stage_results):
+                if stage == 'colors':
+                    outputs = (*outputs, self.color_inertia_curve, self.colony_lab_colors)
+                store(stage, outputs)
+            morph_df = self.morph_df = self.stage_outputs['morphology']
+            colony_data, clusters, self.color_inertia_curve, self.colony_lab_colors = self.stage_outputs['colors']
+            self.colony_data = colony_data
+            density_df = self.density_df = self.stage_outputs['density']
+            
+            # combine and score
+            if cached('scores'):
+                combined_df, scores_df = self.stage_outputs['scores']
+                self.combined_df, self.scores_df = combined_df, scores_df
+            else:
+                with profiler.stage('scores'):
+                    print("combining initial analysis results...")
+                    combined_df = self.combine_analyses(morph_df, colony_data, density_df)
+                    
+                    print("calculating colony scores and rankings...")
+                    scores_df = self.calculate_scores(combined_df)
+                    
+                    print("merging scores back into combined dataset...")
+                    combined_df = self.combine_analyses(morph_df, colony_data, density_df, scores_df)
+                    store('scores', (combined_df, scores_df))
+            
+            print(f"selecting top {self.n_top_colonies} colonies...")
+            if cached('selection'):
+                top_colonies = self.stage_outputs['selection']
+                self.top_colonies = top_colonies
+            else:
+                with profiler.stage('selection'):
+                    top_colonies = store('selection', self.select_top_colonies(scores_df, n=self.n_top_colonies,
+                                                                              penalty_factor=self.penalty_factor))
+        
+        stage_order = [stage for stage, _, _ in self.STAGE_GRAPH]
+        self.stage_timings = profiler.to_frame(stage_order)
+        if self.trace_path:
+            append_trace(self.trace_path, {
+                'image': image_key[:16],
+                'image_shape': list(original.shape),
+                'n_colonies': len(colony_props),
+                'total_wall_s': profiler.total_wall_s(),
+                'stages': profiler.ordered_records(stage_order),
+            })
         
         print("analysis pipeline completed successfully")
         return {
@@ -743,11 +1338,15 @@ class ColonyAnalyzer:
             'processed_image': processed,
             'plate_mask': plate_mask,
             'colony_labels': colony_labels,
+            'colony_distance_map': self.colony_distance_map,
             'colony_properties': colony_props,
             'morph_df': morph_df,
             'colony_data': colony_data,
+            'color_inertia_curve': self.color_inertia_curve,
+            'colony_lab_colors': self.colony_lab_colors,
             'density_df': density_df,
             'combined_df': combined_df,
             'scores_df': scores_df,
-            'top_colonies': top_colonies
-        } 
\ No newline at end of file
+            'top_colonies': top_colonies,
+            'stage_timings': self.stage_timings
+        }
@@ -0,0 +1,124 @@
+# colony_table.py
+# columnar table of segmented colonies, used in place of a list of skimage RegionProperties
+# label / area / bbox / centroid are numpy columns computed in one pass over the label image,
+# any other regionprops attribute (perimeter, solidity, ...) is computed per colony only when asked for
+
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+from skimage import measure
+
+
+class ColonyRecord:
+    # one row of a ColonyTable, behaves like a RegionProperties for the attributes the app reads
+    __slots__ = ('table', 'index', '_region')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+        self._region = None
+
+    @property
+    def label(self):
+        return int(self.table.label[self.index])
+
+    @property
+    def area(self):
+        return self.table.area[self.index]
+
+    @property
+    def bbox(self):
+        return tuple(int(v) for v in self.table.bbox[self.index])
+
+    @property
+    def centroid(self):
+        return tuple(self.table.centroid[self.index])
+
+    def __getattr__(self, name):
+        # everything else comes from a RegionProperties built for this colony on first use
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._region is None:
+            self._region = self.table.region(self.index)
+        return getattr(self._region, name)
+
+    def __repr__(self):
+        return f"ColonyRecord(label={self.label}, area={self.area}, bbox={self.bbox})"
+
+
+class ColonyTable:
+    # columns: label (int32), area (float64, like regionprops), bbox (N, 4) min_row, min_col, max_row, max_col,
+    # centroid (N, 2) row, col; label_image is kept only for lazily computed attributes
+    def __init__(self, label, area, bbox, centroid, label_image=None):
+        self.label = label
+        self.area = area
+        self.bbox = bbox
+        self.centroid = centroid
+        self.label_image = label_image
+
+    @classmethod
+    def from_label_image(cls, label_image):
+        # one bincount / find_objects pass instead of a RegionProperties object per colony
+        flat = label_image.ravel()
+        foreground = np.flatnonzero(flat)
+        ids = flat[foreground]
+        counts = np.bincount(ids)
+        label = np.flatnonzero(counts[1:]).astype(np.int32) + 1
+
+        # coordinate sums are exact integers, so sum / count equals regionprops' mean of coords
+        rows, cols = np.divmod(foreground, label_image.shape[1])
+        row_sums = np.bincount(ids, weights=rows, minlength=len(counts))
+        col_sums = np.bincount(ids, weights=cols, minlength=len(counts))
+        area = counts[label].astype(np.float64)
+        centroid = np.stack([row_sums[label], col_sums[label]], axis=1) / area[:, None]
+
+        slices = ndimage.find_objects(label_image)
+        bbox = np.array([(slices[i - 1][0].start, slices[i - 1][1].start,
+                          slices[i - 1][0].stop, slices[i - 1][1].stop) for i in label],
+                        dtype=np.int64).reshape(-1, 4)
+        return cls(label, area, bbox, centroid, label_image)
+
+    def __len__(self):
+        return len(self.label)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield ColonyRecord(self, i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            # row subset sharing the same label image, used to hand chunks of colonies to workers
+            return ColonyTable(self.label[index], self.area[index], self.bbox[index],
+                               self.centroid[index], self.label_image)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return ColonyRecord(self, index)
+
+    def region(self, index):
+        # skimage RegionProperties for one colony, computed from its bounding box crop only
+        # (records keep the one they built, the table itself caches nothing)
+        if self.label_image is None:
+            raise AttributeError("colony table was compacted, only label/area/bbox/centroid are available")
+        minr, minc, maxr, maxc = self.bbox[index]
+        label = self.label[index]
+        crop = self.label_image[minr:maxr, minc:maxc]
+        single = np.where(crop == label, crop, 0)
+        return measure.regionprops(single, offset=(minr, minc))[0]
+
+    def compact(self):
+        # copy without the label image reference, small enough to pickle between processes
+        return ColonyTable(self.label, self.area, self.bbox, self.centroid)
+
+    def to_frame(self):
+        return pd.DataFrame({
+            'label': self.label,
+            'area': self.area,
+            'centroid_row': self.centroid[:, 0],
+            'centroid_col': self.centroid[:, 1],
+            'min_row': self.bbox[:, 0],
+            'min_col': self.bbox[:, 1],
+            'max_row': self.bbox[:, 2],
+            'max_col': self.bbox[:, 3],
+        })
@@ -0,0 +1,113 @@
+# color_palette.py
+# global colony color palette shared across plates
+# a MiniBatchKMeans over lab colors whose scaling is frozen when the palette is fitted on a reference set,
+# so a color cluster id means the same color on every plate. plates are assigned to the nearest palette
+# color and can refine it with partial_fit as they stream in, without renumbering the clusters.
+
+import os
+import pickle
+import hashlib
+import tempfile
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+from result_cache import default_cache_dir
+
+
+def default_palette_path():
+    return os.path.join(default_cache_dir(), 'color_palette.pkl')
+
+
+class ColorPalette:
+    def __init__(self, n_clusters=6, random_state=42, batch_size=1024):
+        self.n_clusters = n_clusters
+        self.random_state = random_state
+        self.batch_size = batch_size
+        self.model = None
+        # lab scaling of the reference set, kept fixed afterwards so updates do not shift the space
+        self.mean = None
+        self.scale = None
+        self.n_colonies = 0
+
+    @property
+    def fitted(self):
+        return self.model is not None
+
+    def scaled(self, lab_colors):
+        return (np.asarray(lab_colors, dtype=np.float64).reshape(-1, 3) - self.mean) / self.scale
+
+    def fit(self, lab_colors):
+        # fit the palette from scratch on a reference set of colony lab colors
+        lab_colors = np.asarray(lab_colors, dtype=np.float64).reshape(-1, 3)
+        if len(lab_colors) < self.n_clusters:
+            raise ValueError(f"need at least {self.n_clusters} colonies to fit the palette, got {len(lab_colors)}")
+        self.mean = lab_colors.mean(axis=0)
+        scale = lab_colors.std(axis=0)
+        self.scale = np.where(scale > 0, scale, 1.0)
+        # reassignment_ratio=0: a rarely hit palette color is never moved elsewhere, ids stay stable
+        self.model = MiniBatchKMeans(n_clusters=self.n_clusters, random_state=self.random_state,
+                                     batch_size=self.batch_size, n_init=3, reassignment_ratio=0)
+        self.model.fit(self.scaled(lab_colors))
+        self.n_colonies = len(lab_colors)
+        return self
+
+    def partial_fit(self, lab_colors):
+        # refine the palette with one more plate, the first call on an unfitted palette fits it
+        lab_colors = np.asarray(lab_colors, dtype=np.float64).reshape(-1, 3)
+        if not self.fitted:
+            return self.fit(lab_colors)
+        if len(lab_colors) > 0:
+            self.model.partial_fit(self.scaled(lab_colors))
+            self.n_colonies += len(lab_colors)
+        return self
+
+    def assign(self, lab_colors):
+        # nearest palette color for each colony
+        points = self.scaled(lab_colors)
+        centers = self.model.cluster_centers_
+        distances = (points ** 2).sum(axis=1)[:, None] - 2 * points @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+        return np.argmin(distances, axis=1)
+
+    def centers_lab(self):
+        # palette colors back in lab space
+        return self.model.cluster_centers_ * self.scale + self.mean
+
+    def fingerprint(self):
+        # changes whenever the palette colors change, used in analysis cache keys
+        if not self.fitted:
+            return 'unfitted'
+        digest = hashlib.sha256()
+        for array in (self.mean, self.scale, self.model.cluster_centers_):
+            digest.update(np.ascontiguousarray(array, dtype=np.float64).data)
+        return digest.hexdigest()[:16]
+
+    def __repr__(self):
+        return f"ColorPalette(n_clusters={self.n_clusters}, fingerprint={self.fingerprint()})"
+
+    def save(self, path=None):
+        # written to a temp file and renamed, so a concurrent load never sees a partial palette
+        path = path or default_palette_path()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        # saved palette, or None when there is none (or it cannot be read)
+        path = path or default_palette_path()
+        try:
+            with open(path, 'rb') as f:
+                palette = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return palette if isinstance(palette, cls) else None
@@ -0,0 +1,149 @@
+# diverse_selection.py
+# greedy diverse top-n colony selection shared by colony_analyzer.py and image_analysis_pipeline.py
+#
+# every pick multiplies the score of each remaining colony with the same color cluster, and again of
+# each one with the same form, by (1 - penalty_factor). colonies sharing a (cluster, form) pair
+# therefore always carry the same number of penalties, so they keep their relative order: each group
+# is sorted once and only its best remaining member (the head) has to be compared per pick.
+# penalties are applied lazily as a per-group count, never by rewriting the whole pool.
+
+import numpy as np
+import pandas as pd
+
+
+def category_codes(values, size):
+    # integer code per row plus which codes are NaN (NaN never equals itself, so it is never penalized)
+    if values is None:
+        return np.zeros(size, dtype=np.int64), np.array([True])
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=False)
+    return codes.astype(np.int64), pd.isna(uniques)
+
+
+def penalized(value, n_penalties, factor):
+    # repeated multiplication, bit-identical to applying *= factor once per penalty
+    # (factor ** n_penalties would round differently)
+    value = float(value)
+    for _ in range(n_penalties):
+        value *= factor
+    return value
+
+
+def select_diverse_indices(bio_interest, color_cluster=None, form=None, n=20, penalty_factor=0.5, tie_order=None):
+    # row positions of the picks, in pick order
+    # - while some color cluster has fewer than n // n_clusters picks, only those clusters are eligible
+    # - the highest penalized bio_interest wins, ties go to the smallest tie_order (row order by default)
+    bio = np.asarray(bio_interest, dtype=np.float64)
+    size = len(bio)
+    if size == 0 or n <= 0:
+        return []
+    tie_order = np.arange(size) if tie_order is None else np.asarray(tie_order)
+    factor = 1 - penalty_factor
+
+    cluster_codes, cluster_nan = category_codes(color_cluster, size)
+    form_codes, form_nan = category_codes(form, size)
+    use_cluster = color_cluster is not None
+    use_form = form is not None
+
+    # groups of colonies sharing (cluster, form); positions below index the rows sorted by
+    # group, then best score first, then tie_order
+    group_ids, group_keys = pd.factorize(cluster_codes * len(form_nan) + form_codes)
+    n_groups = len(group_keys)
+    group_cluster = np.asarray(group_keys) // len(form_nan)
+    group_form = np.asarray(group_keys) % len(form_nan)
+    order = np.lexsort((tie_order, -bio, group_ids))
+    sorted_groups = group_ids[order]
+    sorted_bio = bio[order]
+    sorted_tie = tie_order[order]
+    group_start = np.searchsorted(sorted_groups, np.arange(n_groups), side='left')
+    group_end = np.searchsorted(sorted_groups, np.arange(n_groups), side='right')
+    run_start = np.flatnonzero(np.r_[True, (sorted_groups[1:] != sorted_groups[:-1])
+                                     | (sorted_bio[1:] != sorted_bio[:-1])])
+    # end of the run of equal scores each position belongs to
+    run_end = np.repeat(np.r_[run_start[1:], size], np.diff(np.r_[run_start, size]))
+    # the same positions ordered by group, then tie_order only
+    by_tie = np.lexsort((sorted_tie, sorted_groups))
+
+    removed = np.zeros(size, dtype=bool)
+    head = group_start.copy()
+    tie_head = group_start.copy()
+    n_penalties = np.zeros(n_groups, dtype=np.int64)
+    # penalized score of each group's head, of the first lower score after it, and of its last member
+    head_value = sorted_bio[head].copy()
+    has_next = run_end[head] < group_end
+    next_value = sorted_bio[np.minimum(run_end[head], size - 1)].copy()
+    tail_value = sorted_bio[group_end - 1].copy()
+
+    # quota per color cluster
+    n_clusters = len(cluster_nan) if use_cluster else 0
+    min_quota = n // n_clusters if n_clusters > 0 else 0
+    picks_per_cluster = np.zeros(max(n_clusters, 1), dtype=np.int64)
+
+    selected = []
+    for _ in range(n):
+        alive = head < group_end
+        if not alive.any():
+            break
+        eligible = alive
+        if use_cluster and min_quota > 0:
+            under = picks_per_cluster < min_quota
+            if under.any():
+                eligible = alive & under[group_cluster]
+                if not eligible.any():
+                    eligible = alive
+
+        candidates = np.flatnonzero(eligible)
+        values = np.where(np.isnan(head_value[candidates]), -np.inf, head_value[candidates])
+        best_value = values.max()
+
+        # best member per tied group: normally the head, which has the smallest tie_order of its run of
+        # equal scores, unless lower scores collapsed onto the same penalized value (rounding or underflow)
+        tied_groups = candidates[values == best_value]
+        tied_pos = head[tied_groups]
+        collapsed = has_next[tied_groups] & (next_value[tied_groups] == best_value)
+        whole = collapsed & (tail_value[tied_groups] == best_value)
+        tied_pos[whole] = by_tie[tie_head[tied_groups[whole]]]
+        for i in np.flatnonzero(collapsed & ~whole):
+            g = tied_groups[i]
+            # penalized scores only decrease along the group, binary search the end of the tie
+            lo, hi = run_end[tied_pos[i]], group_end[g] - 1
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if penalized(sorted_bio[mid], n_penalties[g], factor) == best_value:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            tied = np.arange(tied_pos[i], lo + 1)
+            tied = tied[~removed[tied]]
+            tied_pos[i] = tied[np.argmin(sorted_tie[tied])]
+        pos = tied_pos[np.argmin(sorted_tie[tied_pos])]
+
+        row = order[pos]
+        selected.append(int(row))
+        removed[pos] = True
+        g = sorted_groups[pos]
+        previous_run_end = run_end[head[g]]
+        while head[g] < group_end[g] and removed[head[g]]:
+            head[g] += 1
+        while tie_head[g] < group_end[g] and removed[by_tie[tie_head[g]]]:
+            tie_head[g] += 1
+        if previous_run_end <= head[g] < group_end[g]:
+            head_value[g] = penalized(sorted_bio[head[g]], n_penalties[g], factor)
+            has_next[g] = run_end[head[g]] < group_end[g]
+            if has_next[g]:
+                next_value[g] = penalized(sorted_bio[run_end[head[g]]], n_penalties[g], factor)
+
+        if use_cluster:
+            picks_per_cluster[cluster_codes[row]] += 1
+        # penalize every group sharing the picked cluster, then every group sharing the picked form
+        penalized_groups = []
+        if use_cluster and not cluster_nan[cluster_codes[row]]:
+            penalized_groups.append(group_cluster == cluster_codes[row])
+        if use_form and not form_nan[form_codes[row]]:
+            penalized_groups.append(group_form == form_codes[row])
+        for matching in penalized_groups:
+            head_value[matching] *= factor
+            next_value[matching] *= factor
+            tail_value[matching] *= factor
+            n_penalties[matching] += 1
+
+    return selected
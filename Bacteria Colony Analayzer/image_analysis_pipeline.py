@@ -217,21 +217,22 @@ original_image = load_and_display_image(image_path)
 def preprocess_plate_image(original_image):
     print("Cleaning and enhancing image quality")
 
-    img = original_image.copy()
-
     # step 1: denoise while keeping edges sharp
-    img_denoised = cv2.bilateralFilter(img, 9, 75, 75)
+    img_denoised = cv2.bilateralFilter(original_image, 9, 75, 75)
 
-    # step 2: enhance contrast using CLAHE
-    lab = cv2.cvtColor(img_denoised, cv2.COLOR_RGB2LAB)
+    # step 2: enhance contrast using CLAHE (the lab image is updated in place)
+    lab = cv2.cvtColor(img_denoised, cv2.COLOR_RGB2LAB, dst=img_denoised)
     clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-    lab[:,:,0] = clahe.apply(lab[:,:,0])
+    lightness = cv2.extractChannel(lab, 0)
+    clahe.apply(lightness, dst=lightness)
+    cv2.insertChannel(lightness, lab, 0)
     img_enhanced = cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
 
     # step 3: gamma correction for better colony visibility
+    # a 256-entry lookup table keeps the image in uint8 instead of a float64 np.power over every pixel
     gamma = 1.2
-    img_gamma = np.power(img_enhanced / 255.0, gamma) * 255
-    img_gamma = img_gamma.astype(np.uint8)
+    gamma_lut = (np.power(np.arange(256) / 255.0, gamma) * 255).astype(np.uint8)
+    img_gamma = cv2.LUT(img_enhanced, gamma_lut)
 
     # step 4: sharpen image slightly
     kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
@@ -601,6 +602,8 @@ from sklearn.preprocessing import StandardScaler
 from skimage import color
 import cv2
 from collections import Counter
+# shared with the app, upload color_utils.py next to your image in colab
+from color_utils import rgb_to_lab_batch, lab_to_rgb_batch
 
 def extract_dominant_colors(colony_pixels, n_colors=3):
     """get dominant colors instead of mean"""
@@ -618,18 +621,6 @@ def extract_dominant_colors(colony_pixels, n_colors=3):
 
     return kmeans.cluster_centers_[dominant_label]
 
-def rgb_to_lab_batch(rgb_colors):
-    #convert rgb to lab color space
-    rgb_normalized = rgb_colors / 255.0
-    lab_colors = []
-
-    for rgb in rgb_normalized:
-        rgb_img = rgb.reshape(1, 1, 3)
-        lab_img = color.rgb2lab(rgb_img)
-        lab_colors.append(lab_img[0, 0])
-
-    return np.array(lab_colors)
-
 def analyze_colony_colors_kmeans(processed_image, colony_labels, colony_properties):
     print("Analyzing colony colors with kmeans clustering")
 
@@ -709,11 +700,8 @@ def analyze_colony_colors_kmeans(processed_image, colony_labels, colony_properti
             cluster_lab = lab_colors[cluster_mask]
             center_lab = np.mean(cluster_lab, axis=0)
 
-            # convert back to rgb using skimage.color
-            center_lab_img = center_lab.reshape(1, 1, 3)
-            from skimage import color as skcolor
-            center_rgb_img = skcolor.lab2rgb(center_lab_img)
-            center_rgb = (center_rgb_img[0, 0] * 255).astype(int)
+            # convert back to rgb
+            center_rgb = lab_to_rgb_batch(center_lab.reshape(1, 3))[0].astype(int)
             cluster_representative_colors.append(center_rgb)
         else:
             cluster_representative_colors.append([128, 128, 128])
@@ -1137,42 +1125,18 @@ def calculate_optimized_scores(combined_df):
             scores[c] = combined_df[c]
     return scores
 
+# shared with the app, upload diverse_selection.py next to your image in colab
+from diverse_selection import select_diverse_indices
+
 # greedy selection with quotas to ensure minimal cluster representation
 def select_diverse_top(scores_df, n=20, penalty_factor=0.5):
     #pick top scoring colonies while enforcing minimum per-cluster quota
-    selected = []
-    pool = scores_df.copy().set_index('colony_id')
-    # determine quotas per unique color cluster
-    clusters = pool['color_cluster'].unique() if 'color_cluster' in pool else []
-    k = len(clusters)
-    min_quota = n // k if k>0 else 0
-    quota = {c:0 for c in clusters}
-
-    for _ in range(n):
-        if pool.empty:
-            break
-        # enforce quota: select from clusters under quota first
-        under = [c for c,count in quota.items() if count < min_quota]
-        if under:
-            cand = pool[pool['color_cluster'].isin(under)]
-        else:
-            cand = pool
-        # pick best candidate
-        best = cand['bio_interest'].idxmax()
-        selected.append(best)
-        # update quota
-        if 'color_cluster' in pool:
-            c = pool.loc[best,'color_cluster']
-            quota[c] = quota.get(c,0) + 1
-        # penalize same cluster/form in pool
-        attrs = ['color_cluster','form']
-        row = pool.loc[best]
-        for attr in attrs:
-            if attr in row:
-                mask = pool[attr]==row[attr]
-                pool.loc[mask,'bio_interest'] *= (1-penalty_factor)
-        # remove picked
-        pool = pool.drop(best)
+    #each pick penalizes the remaining colonies of the same cluster/form, ties go to the earliest row
+    columns = {attr: scores_df[attr].to_numpy() if attr in scores_df else None
+               for attr in ['color_cluster', 'form']}
+    picks = select_diverse_indices(scores_df['bio_interest'].to_numpy(), columns['color_cluster'],
+                                   columns['form'], n=n, penalty_factor=penalty_factor)
+    selected = scores_df['colony_id'].to_numpy()[picks].tolist()
     return scores_df.set_index('colony_id').loc[selected].reset_index()
 
 #usage: this is just running your function to get the output
@@ -0,0 +1,185 @@
+# result_cache.py
+# persistent on-disk cache for ColonyAnalyzer results
+# entries are keyed by (image content hash, analyzer parameters, analysis code version)
+# and evicted least-recently-used first once the cache grows past max_bytes
+
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import tempfile
+
+import cv2
+import numpy as np
+
+from colony_table import ColonyTable
+
+# source files whose contents define the analysis results, editing any of them invalidates the cache
+ANALYSIS_SOURCES = ['colony_analyzer.py', 'color_utils.py', 'colony_table.py', 'diverse_selection.py', 'color_palette.py']
+
+# results entries stored as losslessly png-encoded images
+IMAGE_KEYS = ['original_image', 'processed_image']
+# results entries stored as (compressed) numpy arrays
+ARRAY_KEYS = ['plate_mask', 'colony_labels', 'colony_distance_map', 'final_binary_mask', 'colony_lab_colors']
+# results entries stored as pickled tables
+TABLE_KEYS = ['morph_df', 'colony_data', 'color_inertia_curve', 'density_df', 'combined_df', 'scores_df', 'top_colonies']
+
+# parameters that only change how fast the analysis runs, not its output, so they are not part of the key
+SPEED_ONLY_PARAMS = ('n_jobs', 'preprocess_tile_rows', 'profile_memory', 'trace_path')
+
+_code_version = None
+
+
+def code_version():
+    # hash of the analysis source files, computed once per process
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        module_dir = os.path.dirname(os.path.abspath(__file__))
+        for name in ANALYSIS_SOURCES:
+            path = os.path.join(module_dir, name)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        _code_version = digest.hexdigest()[:16]
+    return _code_version
+
+
+def image_content_hash(image_source):
+    # sha256 of the encoded image bytes (path, bytes, memoryview or file-like upload)
+    # decoded arrays are hashed together with their shape and dtype
+    if isinstance(image_source, np.ndarray) and image_source.ndim >= 2:
+        digest = hashlib.sha256(repr((image_source.shape, image_source.dtype.str)).encode())
+        digest.update(np.ascontiguousarray(image_source).data)
+        return digest.hexdigest()
+    if isinstance(image_source, (str, os.PathLike)):
+        digest = hashlib.sha256()
+        with open(image_source, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    if hasattr(image_source, 'getbuffer'):
+        image_source = image_source.getbuffer()
+    elif hasattr(image_source, 'read'):
+        # rewind afterwards so the same stream can still be decoded
+        position = image_source.tell()
+        data = image_source.read()
+        image_source.seek(position)
+        image_source = data
+    return hashlib.sha256(image_source).hexdigest()
+
+
+def default_cache_dir():
+    return os.environ.get('COLONY_CACHE_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'colony_analyzer'))
+
+
+class ResultCache:
+    def __init__(self, cache_dir=None, max_bytes=2 * 1024**3):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, image_source, params):
+        # params are the ColonyAnalyzer keyword arguments, order does not matter
+        params = {k: v for k, v in params.items() if k not in SPEED_ONLY_PARAMS}
+        payload = json.dumps({
+            'image': image_content_hash(image_source),
+            'params': params,
+            'code': code_version(),
+        }, sort_keys=True, default=repr)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        # return the cached results dict, or None on a miss
+        path = self.entry_path(key)
+        try:
+            with np.load(os.path.join(path, 'arrays.npz')) as arrays:
+                results = {name: arrays[name] for name in arrays.files}
+            with open(os.path.join(path, 'tables.pkl'), 'rb') as f:
+                results.update(pickle.load(f))
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            # missing, half-evicted or unreadable entry counts as a miss
+            return None
+
+        for name in IMAGE_KEYS:
+            if name in results:
+                results[name] = cv2.cvtColor(cv2.imdecode(results[name], cv2.IMREAD_UNCHANGED), cv2.COLOR_BGR2RGB)
+        if 'colony_labels' in results:
+            results['colony_labels'] = results['colony_labels'].astype(np.int32)
+            # the colony table is one cheap pass over the labels, so it is rebuilt instead of stored
+            results['colony_properties'] = ColonyTable.from_label_image(results['colony_labels'])
+
+        # bump the entry so eviction sees it as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return results
+
+    def put(self, key, results):
+        # write the entry to a temp dir first and rename it into place,
+        # so concurrent sessions never read a partial entry
+        if results is None:
+            return
+        arrays = {}
+        for name in IMAGE_KEYS:
+            if results.get(name) is not None:
+                ok, encoded = cv2.imencode('.png', cv2.cvtColor(results[name], cv2.COLOR_RGB2BGR))
+                if ok:
+                    arrays[name] = encoded
+        for name in ARRAY_KEYS:
+            if results.get(name) is not None:
+                arrays[name] = np.asarray(results[name])
+        if 'colony_labels' in arrays:
+            # labels rarely exceed 65535, store them in the smallest unsigned type that fits
+            labels = arrays['colony_labels']
+            dtype = np.uint16 if labels.max(initial=0) <= np.iinfo(np.uint16).max else np.uint32
+            arrays['colony_labels'] = labels.astype(dtype)
+        tables = {name: results[name] for name in TABLE_KEYS if name in results}
+
+        tmp_path = tempfile.mkdtemp(prefix='.tmp-', dir=self.cache_dir)
+        try:
+            np.savez_compressed(os.path.join(tmp_path, 'arrays.npz'), **arrays)
+            with open(os.path.join(tmp_path, 'tables.pkl'), 'wb') as f:
+                pickle.dump(tables, f, protocol=pickle.HIGHEST_PROTOCOL)
+            path = self.entry_path(key)
+            if os.path.exists(path):
+                shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return
+        self.evict()
+
+    def entries(self):
+        # (last used time, size in bytes, path) for every complete entry
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((os.stat(path).st_mtime, size, path))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        # drop least recently used entries until the cache fits in max_bytes
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,104 @@
+# stage_profiler.py
+# per-stage timing and memory records for ColonyAnalyzer.run_full_analysis
+# every stage gets wall time, process cpu time, the process peak rss after it and how much the stage
+# raised that peak, and optionally the peak python/numpy allocation seen by tracemalloc
+# (opencv's own buffers are not visible to tracemalloc, the rss figures do include them)
+#
+# stages that run side by side (n_jobs > 1) overlap, so their cpu time and memory figures are shared
+
+import os
+import sys
+import json
+import time
+import datetime
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+def peak_rss_mb():
+    # high-water mark of the process resident set size, None where it cannot be read
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos bytes
+    return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024
+
+
+class StageProfiler:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = []
+        self.started_tracing = False
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        return self
+
+    def __exit__(self, *exc):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        return False
+
+    @contextmanager
+    def stage(self, name, **info):
+        # time one stage, the yielded record can be extended with stage specific fields (colony counts, ...)
+        record = {'stage': name, 'cached': False, **info}
+        rss_before = peak_rss_mb()
+        if self.trace_memory:
+            allocated_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = time.perf_counter() - wall_start
+            record['cpu_s'] = time.process_time() - cpu_start
+            rss_after = peak_rss_mb()
+            record['rss_peak_mb'] = rss_after
+            record['rss_peak_growth_mb'] = None if rss_after is None else rss_after - rss_before
+            if self.trace_memory:
+                record['py_alloc_peak_mb'] = (tracemalloc.get_traced_memory()[1] - allocated_before) / 1024**2
+            with self.lock:
+                self.records.append(record)
+
+    def cached(self, name, **info):
+        # a stage served from the analyzer's stage cache
+        with self.lock:
+            self.records.append({'stage': name, 'cached': True, 'wall_s': 0.0, 'cpu_s': 0.0, **info})
+
+    def total_wall_s(self):
+        return time.perf_counter() - self.start_time
+
+    def ordered_records(self, stage_order=None):
+        # records in pipeline order when stage_order is given, stages run side by side finish in any order
+        if stage_order is None:
+            return list(self.records)
+        rank = {stage: i for i, stage in enumerate(stage_order)}
+        return sorted(self.records, key=lambda record: rank.get(record['stage'], len(rank)))
+
+    def to_frame(self, stage_order=None):
+        # one row per stage
+        return pd.DataFrame(self.ordered_records(stage_order))
+
+
+def append_trace(path, entry):
+    # one json line per analysis run; a single small append is atomic enough for concurrent workers
+    entry = {'time': datetime.datetime.now().isoformat(timespec='seconds'), **entry}
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(entry, default=str) + '\n')
@@ -0,0 +1,46 @@
+# test_distance_transform.py
+# colony_distance_transform must equal a separate full-frame edt of every colony, touching or not
+
+import os
+import sys
+
+import numpy as np
+from scipy import ndimage
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from colony_analyzer import ColonyAnalyzer
+
+
+def disc_labels():
+    # two overlapping discs split down the middle, a third one touching the second, one on its own,
+    # and one cut off by the image border
+    yy, xx = np.mgrid[:80, :120]
+    labels = np.zeros((80, 120), dtype=np.int32)
+    for label, (cy, cx, r) in enumerate([(30, 30, 15), (30, 52, 15), (52, 60, 12), (60, 100, 10), (5, 110, 12)], 1):
+        labels[((yy - cy) ** 2 + (xx - cx) ** 2 <= r ** 2) & (labels == 0)] = label
+    return labels
+
+
+def per_label_edt(labels):
+    expected = np.zeros(labels.shape)
+    for label in range(1, labels.max() + 1):
+        mask = labels == label
+        expected[mask] = ndimage.distance_transform_edt(mask)[mask]
+    return expected
+
+
+def test_matches_per_label_edt():
+    labels = disc_labels()
+    distance_map = ColonyAnalyzer().colony_distance_transform(labels)
+    np.testing.assert_allclose(distance_map, per_label_edt(labels), rtol=1e-6)
+
+
+def test_touching_strips():
+    # two 5 pixel colonies side by side: distances rise to the middle of each, not to the shared seam
+    labels = np.zeros((11, 12), dtype=np.int32)
+    labels[:, 1:6] = 1
+    labels[:, 6:11] = 2
+    row = ColonyAnalyzer().colony_distance_transform(labels)[5]
+    np.testing.assert_array_equal(row, [0, 1, 2, 3, 2, 1, 1, 2, 3, 2, 1, 0])
@@ -0,0 +1,52 @@
+# test_image_sources.py
+# run_full_analysis must give the same colonies for a path, an open file handle and an in-memory stream
+
+import io
+import os
+import sys
+
+import cv2
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from colony_analyzer import ColonyAnalyzer
+from result_cache import ResultCache
+
+
+@pytest.fixture(scope='module')
+def plate_path(tmp_path_factory):
+    # central crop of a sample plate keeps the full pipeline fast
+    image = cv2.imread(os.path.join(APP_DIR, 'A2_Day_1.jpg'))
+    h, w = image.shape[:2]
+    path = tmp_path_factory.mktemp('plates') / 'crop.png'
+    cv2.imwrite(str(path), image[h // 2 - 400:h // 2 + 400, w // 2 - 400:w // 2 + 400])
+    return path
+
+
+@pytest.fixture(scope='module')
+def expected_labels(plate_path):
+    results = ColonyAnalyzer().run_full_analysis(str(plate_path))
+    assert results is not None and len(results['colony_properties']) > 0
+    return results['colony_labels']
+
+
+def test_open_file_handle(plate_path, expected_labels):
+    with open(plate_path, 'rb') as f:
+        results = ColonyAnalyzer().run_full_analysis(f)
+    assert results is not None
+    assert (results['colony_labels'] == expected_labels).all()
+
+
+def test_bytes_io(plate_path, expected_labels):
+    results = ColonyAnalyzer().run_full_analysis(io.BytesIO(plate_path.read_bytes()))
+    assert results is not None
+    assert (results['colony_labels'] == expected_labels).all()
+
+
+def test_cache_key_leaves_stream_readable(plate_path, tmp_path):
+    with open(plate_path, 'rb') as f:
+        key = ResultCache(cache_dir=str(tmp_path)).make_key(f, {})
+        assert f.read() == plate_path.read_bytes()
+    assert key == ResultCache(cache_dir=str(tmp_path)).make_key(plate_path.read_bytes(), {})
@@ -0,0 +1,50 @@
+# test_morphology.py
+# regression test for the bounding-box contour tracing in analyze_morphology: morph_df for a fixed
+# synthetic label image must match the table produced by the original full-frame findContours code
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from skimage import measure
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from colony_analyzer import ColonyAnalyzer
+
+EXPECTED_PATH = os.path.join(APP_DIR, 'tests', 'data', 'morphology_expected.csv')
+
+
+def synthetic_labels():
+    # a large disc, a thin ellipse, a lobed star, two touching discs, a disc cut by the image border,
+    # a ring, one label split into two pieces and a tiny square
+    yy, xx = np.mgrid[:300, :460].astype(float)
+    angle = np.arctan2(yy - 200, xx - 320)
+    shapes = [
+        (yy - 130) ** 2 + (xx - 130) ** 2 <= 115 ** 2,
+        ((yy - 60) / 10) ** 2 + ((xx - 320) / 60) ** 2 <= 1,
+        np.hypot(yy - 200, xx - 320) <= 30 + 10 * np.cos(5 * angle),
+        (yy - 270) ** 2 + (xx - 60) ** 2 <= 14 ** 2,
+        (yy - 270) ** 2 + (xx - 87) ** 2 <= 14 ** 2,
+        yy ** 2 + (xx - 440) ** 2 <= 20 ** 2,
+        (np.hypot(yy - 150, xx - 420) <= 25) & (np.hypot(yy - 150, xx - 420) > 10),
+        ((yy >= 270) & (yy < 285) & (xx >= 180) & (xx < 195)) | ((yy >= 275) & (yy < 282) & (xx >= 240) & (xx < 250)),
+        (yy >= 289) & (yy < 292) & (xx >= 300) & (xx < 303),
+    ]
+    labels = np.zeros((300, 460), dtype=np.int32)
+    for label, shape in enumerate(shapes, 1):
+        labels[shape & (labels == 0)] = label
+    return labels
+
+
+def morphology_table(analyzer):
+    labels = synthetic_labels()
+    return analyzer.analyze_morphology(labels, measure.regionprops(labels))
+
+
+def test_morphology_matches_full_frame_baseline():
+    expected = pd.read_csv(EXPECTED_PATH)
+    morph_df = morphology_table(ColonyAnalyzer())
+    pd.testing.assert_frame_equal(morph_df, expected, check_dtype=False, rtol=1e-9)
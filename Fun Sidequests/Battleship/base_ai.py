@@ -59,6 +59,20 @@ class BattleshipAI(ABC):
         else:
             print(f"Warning ({self.player_id}): Attempted to record a result for an already targeted well {move}.")
 
+    def record_ship_sunk(self, length: int) -> None:
+        """
+        Called after `record_shot_result` when that shot sank a ship.
+
+        Games that announce sunk ships report them here; AIs that do not use the information can
+        ignore it.
+
+        Parameters
+        ----------
+        length : int
+            The length of the sunk ship.
+        """
+        pass
+
     def has_won(self) -> bool:
         """
         Checks if the AI has won the game.
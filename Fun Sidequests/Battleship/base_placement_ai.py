@@ -1,6 +1,15 @@
 from abc import ABC, abstractmethod
+from enum import Enum
 from typing import Dict, Any, Tuple, List
 
+
+class WellState(Enum):
+    """State of a well on the opponent board, as seen by the attacking AI."""
+    UNKNOWN = 0
+    MISS = 1
+    HIT = 2
+
+
 class PlacementAI(ABC):
     """Base class for ship placement algorithms."""
 
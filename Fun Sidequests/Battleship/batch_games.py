@@ -0,0 +1,386 @@
+"""
+Batched Battleship games: B boards held as arrays and stepped together, one shot per unfinished game per turn.
+
+Agents follow a batch interface (``reset`` / ``next_shots`` / ``update``) over the indices of the games still
+running. ``BatchRandomAgent``, ``BatchGridAgent`` and ``BatchHeatmapAgent`` play the strategies of
+``RandomAgent``, ``GridAgent`` and ``HeatmapBattleshipAI`` directly on the arrays; ``AgentAdapter`` and
+``BattleshipAIAdapter`` run one ordinary agent or ``BattleshipAI`` per game for everything else.
+
+Usage: python batch_games.py [n_games]
+"""
+import sys
+import time
+from typing import Callable, Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from base_placement_ai import WellState
+from heatmap_ai import placement_density
+
+MISS, HIT, SUNK, REPEAT = 0, 1, 2, 3
+RESULT_NAMES = ('miss', 'hit', 'sunk', 'repeat')
+
+# target mode directions of GridAgent, tried in this order
+DIRECTIONS = np.array([(1, 0), (-1, 0), (0, 1), (0, -1)])
+
+
+def schema_lengths(ship_schema: Dict[str, Any]) -> List[int]:
+    """Ship lengths of a ``ship_schema``, one entry per ship."""
+    return [data['length'] for data in ship_schema.values() for _ in range(data['count'])]
+
+
+class BatchBoards:
+    """
+    B boards of the same shape and fleet.
+
+    ``ship_ids`` holds the index of the ship in each cell (-1 for water), ``shot`` the cells already fired
+    upon and ``remaining`` the unhit cells of every ship.
+    """
+
+    def __init__(self, ship_ids: np.ndarray, ship_lengths: Sequence[int]):
+        self.ship_ids = ship_ids
+        self.ship_lengths = np.asarray(ship_lengths)
+        self.n_games, self.rows, self.cols = ship_ids.shape
+        self.shot = np.zeros(ship_ids.shape, dtype=bool)
+        self.remaining = np.tile(self.ship_lengths, (self.n_games, 1))
+        self.cells_left = np.full(self.n_games, self.ship_lengths.sum())
+
+    @classmethod
+    def random(cls, n_games: int, board_shape: Tuple[int, int], ship_lengths: Sequence[int],
+               rng: Optional[np.random.Generator] = None) -> 'BatchBoards':
+        """
+        Random fleets placed like ``nonself_play.Board``: each ship in turn takes a random orientation and
+        position, redrawn until it overlaps no ship placed before it.
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        rows, cols = board_shape
+        ship_ids = np.full((n_games, rows, cols), -1, dtype=np.int8)
+        for ship, length in enumerate(ship_lengths):
+            pending = np.arange(n_games)
+            while len(pending):
+                horizontal = rng.random(len(pending)) < 0.5
+                row = np.where(horizontal, rng.integers(0, rows, len(pending)),
+                               rng.integers(0, rows - length + 1, len(pending)))
+                col = np.where(horizontal, rng.integers(0, cols - length + 1, len(pending)),
+                               rng.integers(0, cols, len(pending)))
+                offsets = np.arange(length)
+                cell_rows = row[:, None] + np.where(horizontal[:, None], 0, offsets)
+                cell_cols = col[:, None] + np.where(horizontal[:, None], offsets, 0)
+                free = (ship_ids[pending[:, None], cell_rows, cell_cols] < 0).all(axis=1)
+                placed = pending[free]
+                ship_ids[placed[:, None], cell_rows[free], cell_cols[free]] = ship
+                pending = pending[~free]
+        return cls(ship_ids, ship_lengths)
+
+    @classmethod
+    def from_placements(cls, placements: Sequence[List[Dict[str, Any]]], board_shape: Tuple[int, int]) -> 'BatchBoards':
+        """Boards from ``PlacementAI.generate_placement`` outputs, one placement list per game."""
+        rows, cols = board_shape
+        ship_lengths = [ship['length'] for ship in placements[0]]
+        ship_ids = np.full((len(placements), rows, cols), -1, dtype=np.int8)
+        for game, fleet in enumerate(placements):
+            if [ship['length'] for ship in fleet] != ship_lengths:
+                raise ValueError("all placements in a batch need the same fleet")
+            for ship, data in enumerate(fleet):
+                row, col, length = data['row'], data['col'], data['length']
+                if data['direction'] == 'horizontal':
+                    cells = ship_ids[game, row, col:col + length]
+                else:
+                    cells = ship_ids[game, row:row + length, col]
+                if len(cells) != length or (cells >= 0).any():
+                    raise ValueError(f"ship {ship} of game {game} is off the board or overlaps another ship")
+                cells[:] = ship
+        return cls(ship_ids, ship_lengths)
+
+    @property
+    def finished(self) -> np.ndarray:
+        return self.cells_left == 0
+
+    def shoot(self, games: np.ndarray, shots: np.ndarray) -> np.ndarray:
+        """
+        Fire one shot in each of `games` (distinct indices) at `shots` (len(games) x 2).
+
+        Returns
+        -------
+        np.ndarray
+            MISS, HIT, SUNK or REPEAT for each shot, as ``nonself_play.Board.shoot``.
+        """
+        rows, cols = shots[:, 0], shots[:, 1]
+        repeat = self.shot[games, rows, cols]
+        self.shot[games, rows, cols] = True
+        ship = self.ship_ids[games, rows, cols].astype(np.int64)
+        hit = (ship >= 0) & ~repeat
+        self.remaining[games[hit], ship[hit]] -= 1
+        self.cells_left[games[hit]] -= 1
+        sunk = np.zeros(len(games), dtype=bool)
+        sunk[hit] = self.remaining[games[hit], ship[hit]] == 0
+        return np.select([repeat, sunk, hit], [REPEAT, SUNK, HIT], MISS)
+
+    def sunk_lengths(self, games: np.ndarray, shots: np.ndarray) -> np.ndarray:
+        """Length of the ship at each shot (only meaningful where the shot sank it)."""
+        ship = self.ship_ids[games, shots[:, 0], shots[:, 1]]
+        return self.ship_lengths[np.maximum(ship, 0)]
+
+
+class BatchAgent:
+    """Plays every game of a batch; `games` are indices of the games still running."""
+
+    def reset(self, boards: BatchBoards) -> None:
+        self.rows, self.cols = boards.rows, boards.cols
+
+    def next_shots(self, games: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def update(self, games: np.ndarray, shots: np.ndarray, results: np.ndarray, boards: BatchBoards) -> None:
+        pass
+
+
+class BatchRandomAgent(BatchAgent):
+    """``RandomAgent``: every game fires at its cells in its own random order, never twice at a cell."""
+
+    def __init__(self, rng: Optional[np.random.Generator] = None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def reset(self, boards: BatchBoards) -> None:
+        super().reset(boards)
+        self.order = np.argsort(self.rng.random((boards.n_games, boards.rows * boards.cols)), axis=1).astype(np.int32)
+        self.turn = np.zeros(boards.n_games, dtype=np.int64)
+
+    def next_shots(self, games: np.ndarray) -> np.ndarray:
+        cells = self.order[games, self.turn[games]]
+        self.turn[games] += 1
+        return np.stack(np.divmod(cells, self.cols), axis=1)
+
+
+class BatchGridAgent(BatchAgent):
+    """
+    ``GridAgent``: hunts the cells with odd ``row + col`` in a random order, and after a hit walks out from it
+    in the four directions until the ship is reported sunk.
+
+    Like the original, hunting does not skip parity cells already fired upon in target mode, so a game can
+    spend a turn on a repeated shot.
+    """
+
+    def __init__(self, rng: Optional[np.random.Generator] = None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def reset(self, boards: BatchBoards) -> None:
+        super().reset(boards)
+        n = boards.n_games
+        cells = np.arange(boards.rows * boards.cols)
+        hunt_cells = cells[(cells // boards.cols + cells % boards.cols) % 2 == 1]
+        self.hunt_order = hunt_cells[np.argsort(self.rng.random((n, len(hunt_cells))), axis=1)]
+        self.hunt_next = np.zeros(n, dtype=np.int64)
+        self.shot = np.zeros((n, boards.rows, boards.cols), dtype=bool)
+        self.targeting = np.zeros(n, dtype=bool)
+        self.origin = np.zeros((n, 2), dtype=np.int64)
+        self.tried = np.zeros((n, len(DIRECTIONS)), dtype=bool)
+        self.direction = np.full(n, -1)
+        self.has_target = np.zeros(n, dtype=bool)
+        self.target = np.zeros((n, 2), dtype=np.int64)
+
+    def next_shots(self, games: np.ndarray) -> np.ndarray:
+        shots = np.zeros((len(games), 2), dtype=np.int64)
+        chosen = np.zeros(len(games), dtype=bool)
+
+        # target mode: each pass either fires, moves on to the next untried direction or gives up
+        while True:
+            pending = np.flatnonzero(self.targeting[games] & ~chosen)
+            if not len(pending):
+                break
+            g = games[pending]
+            needs_direction = ~self.has_target[g]
+            exhausted = needs_direction & self.tried[g].all(axis=1)
+            self.targeting[g[exhausted]] = False
+            pick = g[needs_direction & ~exhausted]
+            self.direction[pick] = np.argmin(self.tried[pick], axis=1)
+            self.target[pick] = self.origin[pick] + DIRECTIONS[self.direction[pick]]
+            self.has_target[pick] = True
+
+            pending, g = pending[~exhausted], g[~exhausted]
+            row, col = self.target[g, 0], self.target[g, 1]
+            on_board = (row >= 0) & (row < self.rows) & (col >= 0) & (col < self.cols)
+            valid = on_board.copy()
+            valid[on_board] = ~self.shot[g[on_board], row[on_board], col[on_board]]
+            blocked = g[~valid]
+            self.tried[blocked, self.direction[blocked]] = True
+            self.direction[blocked] = -1
+            self.has_target[blocked] = False
+            shots[pending[valid]] = self.target[g[valid]]
+            chosen[pending[valid]] = True
+
+        # hunt mode, with any unshot cell once the parity cells run out
+        hunting = np.flatnonzero(~chosen)
+        g = games[hunting]
+        left = self.hunt_next[g] < self.hunt_order.shape[1]
+        cells = np.empty(len(g), dtype=np.int64)
+        cells[left] = self.hunt_order[g[left], self.hunt_next[g[left]]]
+        self.hunt_next[g[left]] += 1
+        if (~left).any():
+            unshot = ~self.shot[g[~left]].reshape((~left).sum(), -1)
+            cells[~left] = np.argmax(np.where(unshot, self.rng.random(unshot.shape), -1), axis=1)
+        shots[hunting] = np.stack(np.divmod(cells, self.cols), axis=1)
+
+        self.shot[games, shots[:, 0], shots[:, 1]] = True
+        return shots
+
+    def update(self, games: np.ndarray, shots: np.ndarray, results: np.ndarray, boards: BatchBoards) -> None:
+        targeting = self.targeting[games]
+
+        found = games[~targeting & (results == HIT)]
+        self.targeting[found] = True
+        self.origin[found] = shots[~targeting & (results == HIT)]
+        self.tried[found] = False
+        self.direction[found] = -1
+        self.has_target[found] = False
+
+        # keep walking in the same direction after a hit
+        walk = targeting & (results == HIT)
+        self.target[games[walk]] = shots[walk] + DIRECTIONS[self.direction[games[walk]]]
+
+        missed = games[targeting & (results == MISS)]
+        self.tried[missed, self.direction[missed]] = True
+        self.direction[missed] = -1
+        self.has_target[missed] = False
+
+        sunk = games[targeting & (results == SUNK)]
+        self.targeting[sunk] = False
+        self.tried[sunk] = False
+        self.direction[sunk] = -1
+        self.has_target[sunk] = False
+
+
+class BatchHeatmapAgent(BatchAgent):
+    """
+    ``HeatmapBattleshipAI`` on all boards at once; picks exactly the moves the per-game AI would.
+
+    Heatmaps are built `chunk_size` boards at a time, which keeps the temporaries cache sized (about twice
+    as fast as whole 100k-board batches).
+    """
+
+    def __init__(self, ship_schema: Dict[str, Any], chunk_size: int = 1024):
+        self.chunk_size = chunk_size
+        self.ship_counts = {}
+        for length in schema_lengths(ship_schema):
+            self.ship_counts[length] = self.ship_counts.get(length, 0) + 1
+
+    def reset(self, boards: BatchBoards) -> None:
+        super().reset(boards)
+        self.hits = np.zeros(boards.ship_ids.shape, dtype=bool)
+        self.misses = np.zeros(boards.ship_ids.shape, dtype=bool)
+
+    def next_shots(self, games: np.ndarray) -> np.ndarray:
+        cells = np.empty(len(games), dtype=np.int64)
+        for start in range(0, len(games), self.chunk_size):
+            chunk = games[start:start + self.chunk_size]
+            density = placement_density(self.misses[chunk], self.hits[chunk], self.ship_counts)
+            cells[start:start + len(chunk)] = np.argmax(density.reshape(len(chunk), -1), axis=1)
+        return np.stack(np.divmod(cells, self.cols), axis=1)
+
+    def update(self, games: np.ndarray, shots: np.ndarray, results: np.ndarray, boards: BatchBoards) -> None:
+        hit = (results == HIT) | (results == SUNK)
+        self.hits[games[hit], shots[hit, 0], shots[hit, 1]] = True
+        missed = results == MISS
+        self.misses[games[missed], shots[missed, 0], shots[missed, 1]] = True
+
+
+class AgentAdapter(BatchAgent):
+    """One ``nonself_play`` style agent (``reset`` / ``next_shot`` / ``update``) per game."""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self.factory = factory
+
+    def reset(self, boards: BatchBoards) -> None:
+        super().reset(boards)
+        self.agents = [self.factory() for _ in range(boards.n_games)]
+        for agent in self.agents:
+            agent.reset()
+
+    def next_shots(self, games: np.ndarray) -> np.ndarray:
+        return np.array([self.agents[game].next_shot() for game in games], dtype=np.int64).reshape(-1, 2)
+
+    def update(self, games: np.ndarray, shots: np.ndarray, results: np.ndarray, boards: BatchBoards) -> None:
+        for game, shot, result in zip(games, shots, results):
+            self.agents[game].update((int(shot[0]), int(shot[1])), RESULT_NAMES[result])
+
+
+class BattleshipAIAdapter(BatchAgent):
+    """
+    One ``BattleshipAI`` per game, built by ``factory(game_index)``.
+
+    Hits and misses go to ``record_shot_result`` and sunk ships to ``record_ship_sunk``; repeated shots are
+    not recorded again.
+    """
+
+    def __init__(self, factory: Callable[[int], Any]):
+        self.factory = factory
+
+    def reset(self, boards: BatchBoards) -> None:
+        super().reset(boards)
+        self.ais = [self.factory(game) for game in range(boards.n_games)]
+
+    def next_shots(self, games: np.ndarray) -> np.ndarray:
+        return np.array([self.ais[game].select_next_move() for game in games], dtype=np.int64).reshape(-1, 2)
+
+    def update(self, games: np.ndarray, shots: np.ndarray, results: np.ndarray, boards: BatchBoards) -> None:
+        sunk_lengths = boards.sunk_lengths(games, shots)
+        for game, shot, result, length in zip(games, shots, results, sunk_lengths):
+            if result == REPEAT:
+                continue
+            ai = self.ais[game]
+            ai.record_shot_result((int(shot[0]), int(shot[1])), WellState.MISS if result == MISS else WellState.HIT)
+            if result == SUNK:
+                ai.record_ship_sunk(int(length))
+
+
+def play_batch(agent: BatchAgent, boards: BatchBoards, max_turns: Optional[int] = None) -> np.ndarray:
+    """
+    Play every game on `boards` to the end.
+
+    Parameters
+    ----------
+    agent : BatchAgent
+        The attacking agent, reset here.
+    boards : BatchBoards
+        Fresh boards, one per game.
+    max_turns : int, optional
+        Turns after which unfinished games are abandoned (default: four times the number of cells).
+
+    Returns
+    -------
+    np.ndarray
+        Turns each game took, repeated shots included, as ``nonself_play.play_game`` counts them.
+    """
+    max_turns = max_turns if max_turns is not None else 4 * boards.rows * boards.cols
+    agent.reset(boards)
+    turns = np.zeros(boards.n_games, dtype=np.int64)
+    games = np.flatnonzero(~boards.finished)
+    for _ in range(max_turns):
+        if not len(games):
+            break
+        shots = agent.next_shots(games)
+        results = boards.shoot(games, shots)
+        agent.update(games, shots, results, boards)
+        turns[games] += 1
+        games = games[~boards.finished[games]]
+    return turns
+
+
+if __name__ == '__main__':
+    n_games = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    board_shape = (10, 10)
+    ship_schema = {
+        'carrier': {'length': 5, 'count': 1},
+        'battleship': {'length': 4, 'count': 1},
+        'cruiser': {'length': 3, 'count': 2},
+        'destroyer': {'length': 2, 'count': 1},
+    }
+    rng = np.random.default_rng(0)
+    for name, agent in [('Random', BatchRandomAgent(rng)), ('Grid', BatchGridAgent(rng)),
+                        ('Heatmap', BatchHeatmapAgent(ship_schema))]:
+        boards = BatchBoards.random(n_games, board_shape, schema_lengths(ship_schema), rng)
+        start = time.perf_counter()
+        turns = play_batch(agent, boards)
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {turns.mean():.2f} +- {1.96 * turns.std() / np.sqrt(n_games):.2f} turns, "
+              f"{n_games / elapsed:,.0f} games/s")
@@ -0,0 +1,122 @@
+"""
+Benchmark of HeatmapBattleshipAI's placement heatmap on 10x10 and 100x100 boards.
+
+Checks the vectorized ``possible_locations_probability`` against the original per-placement loop
+(kept here only as a reference) on random partially played boards and times both, then plays the
+same shots with the rebuilt and the incremental heatmap and times a full move of each.
+
+Usage: python benchmark_heatmap.py [n_boards]
+"""
+import sys
+import time
+from typing import Dict, Any
+
+import numpy as np
+
+from heatmap_ai import HeatmapBattleshipAI
+from base_placement_ai import WellState
+
+SHIP_SCHEMA: Dict[str, Any] = {
+    'carrier': {'length': 5, 'count': 1},
+    'battleship': {'length': 4, 'count': 1},
+    'cruiser': {'length': 3, 'count': 2},
+    'destroyer': {'length': 2, 'count': 1},
+}
+
+
+def legacy_locations_probability(rows, cols, board_with_hits, board_with_misses, ship_length):
+    """The original loop: one zero matrix per valid placement, summed at the end."""
+    list_of_probabilities = []
+    for row in range(rows):
+        for col in range(cols - ship_length + 1):
+            segment = range(col, col + ship_length)
+            positions_with_hits = []
+            empty_slots = 0
+            for c in segment:
+                if board_with_misses[row, c] == 0:
+                    if board_with_hits[row, c] == 1:
+                        positions_with_hits.append(c)
+                    empty_slots += 1
+            if empty_slots == ship_length:
+                prob_matrix = np.zeros((rows, cols))
+                multiplier = 4 * len(positions_with_hits) if positions_with_hits else 1
+                for c in segment:
+                    if c not in positions_with_hits:
+                        prob_matrix[row, c] = ship_length * multiplier
+                list_of_probabilities.append(prob_matrix)
+    for col in range(cols):
+        for row in range(rows - ship_length + 1):
+            segment = range(row, row + ship_length)
+            positions_with_hits = []
+            empty_slots = 0
+            for r in segment:
+                if board_with_misses[r, col] == 0:
+                    if board_with_hits[r, col] == 1:
+                        positions_with_hits.append(r)
+                    empty_slots += 1
+            if empty_slots == ship_length:
+                prob_matrix = np.zeros((rows, cols))
+                multiplier = 4 * len(positions_with_hits) if positions_with_hits else 1
+                for r in segment:
+                    if r not in positions_with_hits:
+                        prob_matrix[r, col] = ship_length * multiplier
+                list_of_probabilities.append(prob_matrix)
+    final_matrix = np.zeros((rows, cols))
+    for m in list_of_probabilities:
+        final_matrix += m
+    return final_matrix
+
+
+def random_board(rng, shape, shot_fraction):
+    """Hit (1) / miss (2) encoded boards with a random share of cells already fired upon."""
+    shots = rng.random(shape) < shot_fraction
+    hit = shots & (rng.random(shape) < 0.3)
+    return hit.astype(int), (shots & ~hit).astype(int) * 2
+
+
+def benchmark(shape, n_boards, rng):
+    ai = HeatmapBattleshipAI('bench', shape, SHIP_SCHEMA)
+    boards = [random_board(rng, shape, rng.uniform(0, 0.6)) for _ in range(n_boards)]
+    lengths = sorted({ship['length'] for ship in SHIP_SCHEMA.values()})
+
+    start = time.perf_counter()
+    vectorized = [[ai.possible_locations_probability(h, m, length) for length in lengths] for h, m in boards]
+    vectorized_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reference = [[legacy_locations_probability(*shape, h, m, length) for length in lengths] for h, m in boards]
+    legacy_time = time.perf_counter() - start
+
+    identical = all(np.array_equal(a, b) for va, ra in zip(vectorized, reference) for a, b in zip(va, ra))
+    per_board = 1000 / n_boards
+    print(f"{shape[0]}x{shape[1]}, {n_boards} boards: vectorized {vectorized_time * per_board:.3f} ms/board, "
+          f"loop {legacy_time * per_board:.3f} ms/board, {'identical' if identical else 'DIFFERENT'}")
+
+
+def benchmark_moves(shape, n_moves, rng):
+    ships = rng.random(shape) < 0.2
+    timings = {}
+    moves = {}
+    for incremental in (False, True):
+        ai = HeatmapBattleshipAI('bench', shape, SHIP_SCHEMA, incremental=incremental)
+        moves[incremental] = []
+        start = time.perf_counter()
+        for _ in range(min(n_moves, ships.size)):
+            move = ai.select_next_move()
+            if ai.board_state[move] != WellState.UNKNOWN:
+                break
+            ai.record_shot_result(move, WellState.HIT if ships[move] else WellState.MISS)
+            moves[incremental].append(move)
+        timings[incremental] = (time.perf_counter() - start) / max(len(moves[incremental]), 1)
+    identical = moves[False] == moves[True]
+    print(f"{shape[0]}x{shape[1]}, {len(moves[True])} moves: rebuilt {timings[False] * 1000:.3f} ms/move, "
+          f"incremental {timings[True] * 1000:.3f} ms/move, {'same moves' if identical else 'DIFFERENT moves'}")
+
+
+if __name__ == '__main__':
+    n_boards = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = np.random.default_rng(0)
+    benchmark((10, 10), n_boards, rng)
+    benchmark((100, 100), max(1, n_boards // 50), rng)
+    benchmark_moves((10, 10), 60, rng)
+    benchmark_moves((100, 100), 500, rng)
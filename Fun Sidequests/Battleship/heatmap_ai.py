@@ -1,79 +1,167 @@
 from abc import ABC, abstractmethod
 from typing import Tuple, Dict, Any, List
 import numpy as np
-from enum import Enum
 from base_ai import BattleshipAI
+from base_placement_ai import WellState
 
 
-class WellState(Enum):
-    UNKNOWN = 0
-    MISS = 1
-    HIT = 2
+def window_sums(values: np.ndarray, length: int) -> np.ndarray:
+    """Sum of every run of `length` consecutive cells along the last axis (... x (cols - length + 1))."""
+    cumulative = np.zeros(values.shape[:-1] + (values.shape[-1] + 1,), dtype=np.int64)
+    np.cumsum(values, axis=-1, out=cumulative[..., 1:])
+    return cumulative[..., length:] - cumulative[..., :-length]
+
+
+def placement_weight(window_misses, window_hits, ship_length):
+    """Heat a placement adds to each of its cells, 0 when it covers a miss."""
+    return np.where(window_misses == 0, ship_length * np.where(window_hits > 0, 4 * window_hits, 1), 0)
+
+
+def horizontal_placement_density(misses: np.ndarray, hits: np.ndarray, ship_length: int) -> np.ndarray:
+    """
+    Heat contributed to each cell by every horizontal placement of one ship.
+
+    A placement is valid when it covers no miss. It adds ``ship_length * multiplier`` to each of its
+    cells that is not already a hit, where the multiplier is ``4 * hits covered`` (or 1 without hits).
+    Window counts come from cumulative sums along the rows, so no per-placement matrix is built.
+    Leading axes are treated as a batch of boards.
+    """
+    cols = misses.shape[-1]
+    n_starts = cols - ship_length + 1
+    if n_starts <= 0:
+        return np.zeros(misses.shape, dtype=np.int64)
+
+    window_misses = window_sums(misses, ship_length)
+    window_hits = window_sums(hits, ship_length)
+    weight = placement_weight(window_misses, window_hits, ship_length)
+
+    # cell c is covered by the placements starting at max(0, c - length + 1) .. min(c, n_starts - 1)
+    cumulative_weight = np.zeros(misses.shape[:-1] + (n_starts + 1,), dtype=np.int64)
+    np.cumsum(weight, axis=-1, out=cumulative_weight[..., 1:])
+    cells = np.arange(cols)
+    first = np.maximum(cells - ship_length + 1, 0)
+    last = np.minimum(cells, n_starts - 1) + 1
+    density = cumulative_weight[..., last] - cumulative_weight[..., first]
+    density[hits] = 0
+    return density
+
+
+def placement_density(misses: np.ndarray, hits: np.ndarray, ship_counts: Dict[int, int]) -> np.ndarray:
+    """Heatmap of a whole fleet ({length: count}), horizontal and vertical, over boards (... x rows x cols)."""
+    hits = hits & ~misses
+    density = np.zeros(misses.shape, dtype=np.int64)
+    vertical = density.swapaxes(-1, -2)
+    for length, count in ship_counts.items():
+        density += count * horizontal_placement_density(misses, hits, length)
+        # vertical placements are horizontal placements of the transposed board
+        vertical += count * horizontal_placement_density(misses.swapaxes(-1, -2), hits.swapaxes(-1, -2), length)
+    return density
+
 
 class HeatmapBattleshipAI(BattleshipAI):
-    def __init__(self, player_id: str, board_shape: Tuple[int, int], ship_schema: Dict[str, Any]):
+    def __init__(self, player_id: str, board_shape: Tuple[int, int], ship_schema: Dict[str, Any],
+                 incremental: bool = False):
+        """
+        Parameters
+        ----------
+        incremental : bool
+            Keep the heatmap between moves and only update the placements crossing each recorded shot,
+            instead of rebuilding it every turn. Both modes pick exactly the same moves.
+        """
         super().__init__(player_id, board_shape, ship_schema)
         self.rows, self.cols = board_shape
+        self.incremental = incremental
+        if incremental:
+            self.reset_heatmap()
 
-    def select_next_move(self) -> Tuple[int, int]:
-        board_with_hits = (self.board_state == WellState.HIT).astype(int)
-        board_with_misses = (self.board_state == WellState.MISS).astype(int) * 2
+    def ship_counts(self) -> Dict[int, int]:
+        """Number of ships of each length."""
+        ship_counts = {}
+        for ship, data in self.ship_schema.items():
+            ship_counts[data['length']] = ship_counts.get(data['length'], 0) + data['count']
+        return ship_counts
+
+    def reset_heatmap(self) -> None:
+        """Rebuild the incremental state (placement counts and heatmap) from the current board."""
+        hits = self.board_state == WellState.HIT
+        misses = self.board_state == WellState.MISS
+        self.hits = hits.copy()
+        # per ship length: misses and hits covered by every horizontal placement, and by every vertical
+        # placement in the transposed layout, so a shot at (r, c) touches row r and row c respectively
+        self.placement_counts = {}
+        for length in self.ship_counts():
+            if length > max(self.rows, self.cols):
+                continue
+            self.placement_counts[length] = tuple(
+                (window_sums(m, length), window_sums(h, length)) if m.shape[1] >= length else None
+                for m, h in ((misses, hits), (misses.T, hits.T))
+            )
+        self.heatmap = self.generate_probabilities_for_all_ships(hits.astype(int), misses.astype(int) * 2)
+        self.heatmap = self.heatmap.astype(np.int64)
 
-        prob_matrix = self.generate_probabilities_for_all_ships(board_with_hits, board_with_misses)
+    def select_next_move(self) -> Tuple[int, int]:
+        if self.incremental:
+            prob_matrix = self.heatmap
+        else:
+            board_with_hits = (self.board_state == WellState.HIT).astype(int)
+            board_with_misses = (self.board_state == WellState.MISS).astype(int) * 2
+            prob_matrix = self.generate_probabilities_for_all_ships(board_with_hits, board_with_misses)
         move = np.unravel_index(np.argmax(prob_matrix), prob_matrix.shape)
         return move
 
+    def record_shot_result(self, move: Tuple[int, int], result: WellState) -> None:
+        row, col = move
+        update = self.incremental and self.board_state[row, col] == WellState.UNKNOWN and result != WellState.UNKNOWN
+        super().record_shot_result(move, result)
+        if update:
+            self.update_heatmap(row, col, result)
+
+    def update_heatmap(self, row: int, col: int, result: WellState) -> None:
+        """
+        Apply one new shot to the incremental heatmap.
+
+        Only the (at most ``2 * ship_length``) placements of each length covering the shot change weight,
+        and each spreads its change over ``ship_length`` cells.
+        """
+        counts = self.ship_counts()
+        is_hit = result == WellState.HIT
+        for length, orientations in self.placement_counts.items():
+            # vertical placements are updated through transposed views of the heatmap and hit mask
+            for windows, heatmap, hits, line, cell in (
+                (orientations[0], self.heatmap, self.hits, row, col),
+                (orientations[1], self.heatmap.T, self.hits.T, col, row),
+            ):
+                if windows is None:
+                    continue
+                window_misses, window_hits = windows
+                first, last = max(cell - length + 1, 0), min(cell, window_misses.shape[1] - 1)
+                starts = slice(first, last + 1)
+                before = placement_weight(window_misses[line, starts], window_hits[line, starts], length)
+                if is_hit:
+                    window_hits[line, starts] += 1
+                else:
+                    window_misses[line, starts] += 1
+                after = placement_weight(window_misses[line, starts], window_hits[line, starts], length)
+                for start, delta in zip(range(first, last + 1), counts[length] * (after - before)):
+                    if delta:
+                        heatmap[line, start:start + length] += np.where(hits[line, start:start + length], 0, delta)
+        if is_hit:
+            # hit cells carry no heat, and later updates skip them
+            self.hits[row, col] = True
+            self.heatmap[row, col] = 0
+
     def generate_probabilities_for_all_ships(self, board_with_hits, board_with_misses):
         final = np.zeros((self.rows, self.cols))
-        ship_lengths = []
-        for ship, data in self.ship_schema.items():
-            ship_lengths.extend([data['length']] * data['count'])
-        for length in ship_lengths:
-            final += self.possible_locations_probability(board_with_hits, board_with_misses, length)
+        # ships of the same length share one heatmap
+        for length, count in self.ship_counts().items():
+            final += count * self.possible_locations_probability(board_with_hits, board_with_misses, length)
         return final
 
     def possible_locations_probability(self, board_with_hits, board_with_misses, ship_length):
-        list_of_probabilities = []
-
-        # Horizontal
-        for row in range(self.rows):
-            for col in range(self.cols - ship_length + 1):
-                segment = range(col, col + ship_length)
-                positions_with_hits = []
-                empty_slots = 0
-                for c in segment:
-                    if board_with_misses[row, c] == 0:
-                        if board_with_hits[row, c] == 1:
-                            positions_with_hits.append(c)
-                        empty_slots += 1
-                if empty_slots == ship_length:
-                    prob_matrix = np.zeros((self.rows, self.cols))
-                    multiplier = 4 * len(positions_with_hits) if positions_with_hits else 1
-                    for c in segment:
-                        if c not in positions_with_hits:
-                            prob_matrix[row, c] = ship_length * multiplier
-                    list_of_probabilities.append(prob_matrix)
-
-        # Vertical
-        for col in range(self.cols):
-            for row in range(self.rows - ship_length + 1):
-                segment = range(row, row + ship_length)
-                positions_with_hits = []
-                empty_slots = 0
-                for r in segment:
-                    if board_with_misses[r, col] == 0:
-                        if board_with_hits[r, col] == 1:
-                            positions_with_hits.append(r)
-                        empty_slots += 1
-                if empty_slots == ship_length:
-                    prob_matrix = np.zeros((self.rows, self.cols))
-                    multiplier = 4 * len(positions_with_hits) if positions_with_hits else 1
-                    for r in segment:
-                        if r not in positions_with_hits:
-                            prob_matrix[r, col] = ship_length * multiplier
-                    list_of_probabilities.append(prob_matrix)
-
-        final_matrix = np.zeros((self.rows, self.cols))
-        for m in list_of_probabilities:
-            final_matrix += m
-        return final_matrix
\ No newline at end of file
+        misses = np.asarray(board_with_misses) != 0
+        hits = (np.asarray(board_with_hits) == 1) & ~misses
+
+        # vertical placements are horizontal placements of the transposed board
+        density = horizontal_placement_density(misses, hits, ship_length)
+        density += horizontal_placement_density(misses.T, hits.T, ship_length).T
+        return density.astype(float)
\ No newline at end of file
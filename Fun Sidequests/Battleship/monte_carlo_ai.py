@@ -0,0 +1,216 @@
+import time
+from typing import Tuple, Dict, Any, List, Optional
+import numpy as np
+from base_placement_ai import WellState
+from heatmap_ai import HeatmapBattleshipAI
+
+
+def placement_masks(board_shape: Tuple[int, int], ship_length: int) -> np.ndarray:
+    """Every horizontal then vertical placement of one ship as a flat cell mask (placements x cells)."""
+    rows, cols = board_shape
+    masks = []
+    if ship_length <= cols:
+        for row in range(rows):
+            for col in range(cols - ship_length + 1):
+                mask = np.zeros(board_shape, dtype=bool)
+                mask[row, col:col + ship_length] = True
+                masks.append(mask.ravel())
+    if ship_length <= rows and ship_length > 1:
+        for col in range(cols):
+            for row in range(rows - ship_length + 1):
+                mask = np.zeros(board_shape, dtype=bool)
+                mask[row:row + ship_length, col] = True
+                masks.append(mask.ravel())
+    return np.array(masks, dtype=bool).reshape(-1, rows * cols)
+
+
+def pack_masks(masks: np.ndarray) -> np.ndarray:
+    """Cell masks as bitsets of 64-bit words, so fleet overlaps are a few word-wide ANDs."""
+    n_words = -(-masks.shape[-1] // 64)
+    padded = np.zeros(masks.shape[:-1] + (n_words * 64,), dtype=bool)
+    padded[..., :masks.shape[-1]] = masks
+    return np.packbits(padded, axis=-1, bitorder='little').view(np.uint64)
+
+
+class MonteCarloBattleshipAI(HeatmapBattleshipAI):
+    """
+    Targets the cell most likely to hold a ship under the exact posterior over fleet configurations.
+
+    Instead of scoring each ship's placements independently, the AI samples whole fleets (one placement
+    per ship in ``ship_schema``) that agree with everything seen so far: no ship on a miss, every hit
+    covered, no overlaps, sunk ships lying entirely on hits through the shot that sank them and no
+    other ship fully hit. Proposals are uniform over each ship's still possible placements and
+    inconsistent fleets are rejected, so the accepted fleets are uniform samples of the posterior and
+    the fraction holding a ship in a cell is its hit probability.
+
+    Fleets are drawn a batch at a time as arrays of placement indices, one ship column after the other,
+    and partial fleets that already overlap are dropped before the next ship is drawn. Accepted fleets are
+    kept between moves: after a shot the ones that still agree remain valid posterior samples, so
+    targeting a hit ship rarely needs fresh samples. When no consistent fleet is found within the budget
+    the move falls back to the heatmap of ``HeatmapBattleshipAI``.
+
+    Sunk ships are reported with ``record_ship_sunk``. For games that do not announce them, pass
+    ``announces_sunk=False`` so a ship hit in every cell is not ruled out.
+    """
+
+    def __init__(self, player_id: str, board_shape: Tuple[int, int], ship_schema: Dict[str, Any],
+                 n_samples: int = 1000, batch_size: int = 1000, time_budget: Optional[float] = 0.003,
+                 max_batches: int = 50, announces_sunk: bool = True, seed: Optional[int] = None):
+        """
+        Parameters
+        ----------
+        n_samples : int
+            Consistent fleets to base each move on; sampling stops once the kept fleets reach this.
+        batch_size : int
+            Fleets proposed per vectorized sampling round.
+        time_budget : float, optional
+            Seconds of sampling allowed per move (None for no time limit).
+        max_batches : int
+            Sampling rounds allowed per move.
+        announces_sunk : bool
+            Whether the game reports every sunk ship through ``record_ship_sunk``.
+        seed : int, optional
+            Seed of the sampling random generator.
+        """
+        super().__init__(player_id, board_shape, ship_schema)
+        self.n_samples = n_samples
+        self.batch_size = batch_size
+        self.time_budget = time_budget
+        self.max_batches = max_batches
+        self.announces_sunk = announces_sunk
+        self.rng = np.random.default_rng(seed)
+        self.n_cells = self.rows * self.cols
+
+        # one column per ship, longest first so overlapping partial fleets are dropped early
+        self.ship_lengths = sorted(
+            (data['length'] for data in ship_schema.values() for _ in range(data['count'])), reverse=True
+        )
+        self.masks = {length: placement_masks(board_shape, length) for length in set(self.ship_lengths)}
+        self.bits = {length: pack_masks(masks) for length, masks in self.masks.items()}
+        self.n_words = -(-self.n_cells // 64)
+
+        self.hit_cells = np.zeros(self.n_cells, dtype=bool)
+        self.miss_cells = np.zeros(self.n_cells, dtype=bool)
+        self.last_move: Optional[Tuple[int, int]] = None
+        # ship column -> cell of the shot that sank it
+        self.sunk_at: Dict[int, int] = {}
+        self.fleets = np.empty((0, len(self.ship_lengths)), dtype=np.int64)
+        self.candidates: List[np.ndarray] = []
+        self.update_candidates()
+
+    def record_shot_result(self, move: Tuple[int, int], result: WellState) -> None:
+        row, col = move
+        is_new = self.board_state[row, col] == WellState.UNKNOWN
+        super().record_shot_result(move, result)
+        if not is_new:
+            return
+        self.last_move = move
+        cell = row * self.cols + col
+        if result == WellState.HIT:
+            self.hit_cells[cell] = True
+        elif result == WellState.MISS:
+            self.miss_cells[cell] = True
+        self.update_candidates()
+
+    def record_ship_sunk(self, length: int) -> None:
+        """
+        The last recorded shot sank a ship of `length`.
+
+        The first not yet sunk ship column of that length is pinned to placements through the shot that
+        lie entirely on hits. Kept fleets may label same-length ships the other way round, so they are
+        dropped and sampled afresh.
+        """
+        if self.last_move is None:
+            return
+        free = [s for s, ship_length in enumerate(self.ship_lengths)
+                if ship_length == length and s not in self.sunk_at]
+        if not free:
+            return
+        row, col = self.last_move
+        self.sunk_at[free[0]] = row * self.cols + col
+        self.fleets = self.fleets[:0]
+        self.update_candidates()
+
+    def update_candidates(self) -> None:
+        """Cache the placements each ship column can still take, given the shots so far."""
+        self.candidates = []
+        for s, length in enumerate(self.ship_lengths):
+            masks = self.masks[length]
+            possible = ~masks[:, self.miss_cells].any(axis=1)
+            fully_hit = ~masks[:, ~self.hit_cells].any(axis=1)
+            if s in self.sunk_at:
+                possible &= fully_hit & masks[:, self.sunk_at[s]]
+            elif self.announces_sunk:
+                # a ship hit in every cell would have been reported sunk
+                possible &= ~fully_hit
+            self.candidates.append(np.flatnonzero(possible))
+
+    def occupancy(self, fleets: np.ndarray) -> np.ndarray:
+        """Bitset of the cells covered by each fleet (fleets x words)."""
+        occupied = np.zeros((len(fleets), self.n_words), dtype=np.uint64)
+        for s, length in enumerate(self.ship_lengths):
+            occupied |= self.bits[length][fleets[:, s]]
+        return occupied
+
+    def consistent(self, fleets: np.ndarray) -> np.ndarray:
+        """Which non-overlapping fleets agree with every shot and sunk report so far."""
+        keep = np.ones(len(fleets), dtype=bool)
+        for s, length in enumerate(self.ship_lengths):
+            keep &= np.isin(fleets[:, s], self.candidates[s])
+        hit_bits = pack_masks(self.hit_cells)
+        keep &= ((hit_bits & ~self.occupancy(fleets)) == 0).all(axis=1)
+        return keep
+
+    def sample_fleets(self, n_fleets: int) -> np.ndarray:
+        """Propose `n_fleets` fleets and return the consistent ones as placement indices (fleets x ships)."""
+        fleets = np.empty((n_fleets, len(self.ship_lengths)), dtype=np.int64)
+        occupied = np.zeros((n_fleets, self.n_words), dtype=np.uint64)
+        for s, length in enumerate(self.ship_lengths):
+            candidates = self.candidates[s]
+            if len(candidates) == 0:
+                return fleets[:0]
+            choice = candidates[self.rng.integers(len(candidates), size=len(fleets))]
+            ship_bits = self.bits[length][choice]
+            no_overlap = ((occupied & ship_bits) == 0).all(axis=1)
+            fleets[:, s] = choice
+            occupied |= ship_bits
+            # drop overlapping partial fleets before the next ship is drawn
+            fleets, occupied = fleets[no_overlap], occupied[no_overlap]
+        hit_bits = pack_masks(self.hit_cells)
+        covers_hits = ((hit_bits & ~occupied) == 0).all(axis=1)
+        return fleets[covers_hits]
+
+    def refresh_fleets(self) -> None:
+        """Drop kept fleets the latest shots ruled out and top them up within the sampling budget."""
+        if len(self.fleets):
+            self.fleets = self.fleets[self.consistent(self.fleets)]
+        deadline = None if self.time_budget is None else time.perf_counter() + self.time_budget
+        for _ in range(self.max_batches):
+            if len(self.fleets) >= self.n_samples:
+                break
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            self.fleets = np.concatenate([self.fleets, self.sample_fleets(self.batch_size)])
+        # newest fleets first, they are independent of the earlier moves
+        self.fleets = self.fleets[-self.n_samples:]
+
+    def cell_probabilities(self) -> np.ndarray:
+        """Share of the sampled fleets with a ship in each cell (rows x cols)."""
+        counts = np.zeros(self.n_cells)
+        for s, length in enumerate(self.ship_lengths):
+            placements = np.bincount(self.fleets[:, s], minlength=len(self.masks[length]))
+            counts += placements @ self.masks[length]
+        return (counts / max(len(self.fleets), 1)).reshape(self.rows, self.cols)
+
+    def select_next_move(self) -> Tuple[int, int]:
+        self.refresh_fleets()
+        unknown = self.board_state == WellState.UNKNOWN
+        if len(self.fleets):
+            prob_matrix = self.cell_probabilities()
+        else:
+            board_with_hits = (self.board_state == WellState.HIT).astype(int)
+            board_with_misses = (self.board_state == WellState.MISS).astype(int) * 2
+            prob_matrix = self.generate_probabilities_for_all_ships(board_with_hits, board_with_misses)
+        prob_matrix = np.where(unknown, prob_matrix, -1)
+        move = np.unravel_index(np.argmax(prob_matrix), prob_matrix.shape)
+        return move
@@ -1,5 +1,5 @@
 from typing import Dict, Any, Tuple, List
-from .base_placement_ai import PlacementAI
+from base_placement_ai import PlacementAI
 
 class NaivePlacementAI(PlacementAI):
     """Simple placement algorithm that packs ships row by row."""
@@ -1,7 +1,8 @@
 import numpy as np
-from tqdm import tqdm
 import matplotlib.pyplot as plt
 
+from batch_games import BatchBoards, BatchRandomAgent, BatchGridAgent, play_batch
+
 # Constants
 BOARD_SIZE = 10
 SHIP_SIZES = [5, 4, 3, 3, 2]  # Carrier, Battleship, Cruiser, Submarine, Destroyer
@@ -192,39 +193,6 @@ def play_game(agent, board=None):
         turns += 1
     return turns
 
-if __name__ == '__main__':
-    MODELS = [
-        ('Random', RandomAgent()),
-        ('Grid', GridAgent()),
-        # ('PDF', PDFAgent()),
-        # ('GP', GPAAgent()),
-        # ('MCTS', MCTSAgent()),
-        # ('NN', NNAgent()),
-    ]
-    results = {}
-    total_turns = []
-    for name, agent in MODELS:
-        turns_list = []
-        for _ in tqdm(range(1000), desc=f"Simulating {name}"):
-            turns = play_game(agent)
-            turns_list.append(turns)
-        results[name] = np.mean(turns_list)
-        total_turns.append(turns_list)
-
-    # Plotting
-    names = list(results.keys())
-    values = [results[n] for n in names]
-    plt.figure()
-    plt.bar(names, values)
-    plt.ylabel('Average Turns to Sink All')
-    plt.title('Battleship Agent Performance')
-    plt.show()
-
-
-# Extra Plots
-plt.plot(np.arange(1000), total_turns[0], total_turns[1])
-plt.show() 
-
 # Plotting helpers
 def plot_board(grid, shot_results, title, show_ships):
     ax = plt.gca()
@@ -288,4 +256,36 @@ def simulate_with_steps(agent, show_ships=False, pause=0.5):
     plt.show()
 
 
-simulate_with_steps(GridAgent(), show_ships=True, pause=0.1)
\ No newline at end of file
+if __name__ == '__main__':
+    N_GAMES = 1000
+    MODELS = [
+        ('Random', BatchRandomAgent()),
+        ('Grid', BatchGridAgent()),
+        # ('PDF', PDFAgent()),
+        # ('GP', GPAAgent()),
+        # ('MCTS', MCTSAgent()),
+        # ('NN', NNAgent()),
+    ]
+    results = {}
+    total_turns = []
+    for name, agent in MODELS:
+        # all games of an agent are played at once on a batch of boards
+        boards = BatchBoards.random(N_GAMES, (BOARD_SIZE, BOARD_SIZE), SHIP_SIZES)
+        turns_list = play_batch(agent, boards)
+        results[name] = np.mean(turns_list)
+        total_turns.append(turns_list)
+
+    # Plotting
+    names = list(results.keys())
+    values = [results[n] for n in names]
+    plt.figure()
+    plt.bar(names, values)
+    plt.ylabel('Average Turns to Sink All')
+    plt.title('Battleship Agent Performance')
+    plt.show()
+
+    # Extra Plots
+    plt.plot(np.arange(N_GAMES), total_turns[0], total_turns[1])
+    plt.show()
+
+    simulate_with_steps(GridAgent(), show_ships=True, pause=0.1)
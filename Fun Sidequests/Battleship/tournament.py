@@ -0,0 +1,292 @@
+"""
+Tournament of every attacking AI against every ship placement AI.
+
+Each matchup (attacker x placement x seed) plays a batch of games with ``batch_games`` in a worker process. Every
+game gets its own board: the placement AI's fleet under a flip, rotation and shift drawn from the matchup seed, so
+deterministic placements still give a distribution of games. The shots-to-win of a matchup are written to
+``<results_dir>/<attacker>__<placement>__seed<seed>__games<n>.npz``, one column per field. Matchups whose
+file already exists are skipped, so an interrupted tournament picks up where it stopped.
+
+Usage: python tournament.py [results_dir] [--seeds N] [--games N] [--workers N]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from batch_games import BatchAgent, BatchBoards, BatchHeatmapAgent, BattleshipAIAdapter, play_batch
+from base_placement_ai import PlacementAI
+from random_ai import RandomAI
+from monte_carlo_ai import MonteCarloBattleshipAI
+from naive_placement_ai import NaivePlacementAI
+from worst_config import WorstCasePlacementAI
+
+BOARD_SHAPE: Tuple[int, int] = (10, 10)
+# the fleet WorstCasePlacementAI places
+SHIP_SCHEMA: Dict[str, Any] = {
+    'carrier': {'length': 5, 'count': 1},
+    'battleship': {'length': 4, 'count': 1},
+    'submarine': {'length': 3, 'count': 1},
+    'destroyer': {'length': 2, 'count': 2},
+}
+COLUMNS = ('attacker', 'placement', 'seed', 'game', 'shots', 'won')
+
+
+def random_attacker(seed: int) -> BatchAgent:
+    random.seed(seed)
+    return BattleshipAIAdapter(lambda game: RandomAI(f'random-{game}', BOARD_SHAPE, SHIP_SCHEMA))
+
+
+def heatmap_attacker(seed: int) -> BatchAgent:
+    # plays exactly the moves of HeatmapBattleshipAI, on all games of the matchup at once
+    return BatchHeatmapAgent(SHIP_SCHEMA)
+
+
+def monte_carlo_attacker(seed: int) -> BatchAgent:
+    return BattleshipAIAdapter(
+        # no time budget: the work per move is bounded by samples and batches only, so a seeded matchup
+        # plays the same games however loaded the workers are
+        lambda game: MonteCarloBattleshipAI(f'monte-carlo-{game}', BOARD_SHAPE, SHIP_SCHEMA, n_samples=1000,
+                                            time_budget=None, max_batches=8, seed=seed * 100_003 + game)
+    )
+
+
+# name -> builder of the batch agent for one matchup, given its seed
+ATTACKERS: Dict[str, Callable[[int], BatchAgent]] = {
+    'RandomAI': random_attacker,
+    'HeatmapBattleshipAI': heatmap_attacker,
+    'MonteCarloBattleshipAI': monte_carlo_attacker,
+}
+PLACEMENTS: Dict[str, type] = {
+    'NaivePlacementAI': NaivePlacementAI,
+    'WorstCasePlacementAI': WorstCasePlacementAI,
+}
+
+
+def matchup_path(results_dir: str, attacker: str, placement: str, seed: int, n_games: int) -> str:
+    # the game count is part of the name, so a rerun with another --games does not reuse smaller matchups
+    return os.path.join(results_dir, f'{attacker}__{placement}__seed{seed}__games{n_games}.npz')
+
+
+def fleet_variants(fleet: List[Dict[str, Any]], n_games: int, rng: np.random.Generator) -> BatchBoards:
+    """
+    `n_games` boards holding `fleet` under random symmetries of the board.
+
+    Each board flips, transposes (square boards only) and shifts the fleet within the slack around its bounding
+    box, so the ships keep their lengths and relative layout.
+    """
+    base = BatchBoards.from_placements([fleet], BOARD_SHAPE).ship_ids[0]
+    ship_ids = np.full((n_games,) + base.shape, -1, dtype=base.dtype)
+    for game in range(n_games):
+        board = base
+        if BOARD_SHAPE[0] == BOARD_SHAPE[1] and rng.random() < 0.5:
+            board = board.T
+        if rng.random() < 0.5:
+            board = board[::-1]
+        if rng.random() < 0.5:
+            board = board[:, ::-1]
+        rows, cols = np.nonzero(board >= 0)
+        box = board[rows.min():rows.max() + 1, cols.min():cols.max() + 1]
+        row = rng.integers(0, board.shape[0] - box.shape[0] + 1)
+        col = rng.integers(0, board.shape[1] - box.shape[1] + 1)
+        ship_ids[game, row:row + box.shape[0], col:col + box.shape[1]] = box
+    return BatchBoards(ship_ids, [ship['length'] for ship in fleet])
+
+
+def play_matchup(attacker: str, placement: str, seed: int, n_games: int) -> Dict[str, Any]:
+    """
+    Worker entry point: play `n_games` of one attacker against one placement.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The result columns, plus the seconds spent playing.
+    """
+    placement_ai: PlacementAI = PLACEMENTS[placement](BOARD_SHAPE, SHIP_SCHEMA)
+    fleet = placement_ai.generate_placement()
+    schema_lengths = sorted(data['length'] for data in SHIP_SCHEMA.values() for _ in range(data['count']))
+    if sorted(ship['length'] for ship in fleet) != schema_lengths:
+        raise ValueError(f"{placement} does not place the ships of SHIP_SCHEMA")
+    boards = fleet_variants(fleet, n_games, np.random.default_rng(seed))
+    agent = ATTACKERS[attacker](seed)
+
+    start = time.perf_counter()
+    shots = play_batch(agent, boards)
+    seconds = time.perf_counter() - start
+    return {
+        'attacker': np.full(n_games, attacker),
+        'placement': np.full(n_games, placement),
+        'seed': np.full(n_games, seed),
+        'game': np.arange(n_games),
+        'shots': shots,
+        'won': boards.finished.copy(),
+        'seconds': seconds,
+    }
+
+
+def save_matchup(path: str, result: Dict[str, Any]) -> None:
+    # written to a temp file and renamed, so an interrupted run never leaves a partial matchup behind
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', suffix='.npz', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **result)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_results(results_dir: str, n_games: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    Finished matchups as columns (attacker, placement, seed, game, shots, won, seconds).
+
+    With `n_games`, only the matchups played with that many games are loaded.
+    """
+    suffix = f'__games{n_games}.npz' if n_games is not None else '.npz'
+    names = sorted(os.listdir(results_dir)) if os.path.isdir(results_dir) else []
+    parts = []
+    for name in names:
+        if name.endswith(suffix) and not name.startswith('.tmp-'):
+            with np.load(os.path.join(results_dir, name)) as part:
+                parts.append({column: part[column] for column in part.files})
+    columns = {column: np.concatenate([part[column] for part in parts]) if parts else np.empty(0)
+               for column in COLUMNS}
+    # seconds are per matchup, spread evenly over its games
+    columns['seconds'] = (np.concatenate([np.full(len(part['game']), part['seconds'] / len(part['game']))
+                                          for part in parts]) if parts else np.empty(0))
+    return columns
+
+
+def summarize(results: Dict[str, np.ndarray], z: float = 1.96) -> List[Dict[str, Any]]:
+    """
+    Shots-to-win per attacker and placement.
+
+    Parameters
+    ----------
+    results : Dict[str, np.ndarray]
+        Columns from ``load_results``.
+    z : float
+        Normal quantile of the confidence interval on the mean (1.96 for 95%).
+
+    Returns
+    -------
+    List[Dict[str, Any]]
+        One row per pairing: games, seeds, mean shots with its interval, median, worst game, unfinished
+        games and games per second of playing time.
+    """
+    rows = []
+    pairs = sorted(set(zip(results['attacker'].tolist(), results['placement'].tolist())))
+    for attacker, placement in pairs:
+        mask = (results['attacker'] == attacker) & (results['placement'] == placement)
+        shots = results['shots'][mask]
+        half_width = z * shots.std(ddof=1) / np.sqrt(len(shots)) if len(shots) > 1 else float('nan')
+        rows.append({
+            'attacker': attacker,
+            'placement': placement,
+            'games': len(shots),
+            'seeds': len(np.unique(results['seed'][mask])),
+            'mean_shots': shots.mean(),
+            'ci_low': shots.mean() - half_width,
+            'ci_high': shots.mean() + half_width,
+            'median_shots': np.median(shots),
+            'max_shots': shots.max(),
+            'unfinished': int((~results['won'][mask]).sum()),
+            'games_per_s': len(shots) / results['seconds'][mask].sum(),
+        })
+    return rows
+
+
+def run_tournament(results_dir: str, n_seeds: int = 5, n_games: int = 200, max_workers: Optional[int] = None,
+                   attackers: Optional[List[str]] = None, placements: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Play every missing attacker x placement x seed matchup across a process pool.
+
+    Parameters
+    ----------
+    results_dir : str
+        Directory of the per-matchup result files; existing matchups are not played again.
+    n_seeds : int
+        Seeds per pairing, each a separate matchup.
+    n_games : int
+        Games per matchup.
+    max_workers : int, optional
+        Worker processes (default: one per cpu); 1 plays in this process.
+    attackers, placements : List[str], optional
+        Subsets of ``ATTACKERS`` / ``PLACEMENTS`` to play (default: all).
+
+    Returns
+    -------
+    Dict[str, Any]
+        Matchups played, skipped and failed in this run, the games played and their wall time.
+    """
+    attackers = attackers or list(ATTACKERS)
+    placements = placements or list(PLACEMENTS)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    matchups = [(attacker, placement, seed) for attacker in attackers for placement in placements
+                for seed in range(n_seeds)]
+    todo = [m for m in matchups if not os.path.exists(matchup_path(results_dir, *m, n_games))]
+    report = {'played': 0, 'skipped': len(matchups) - len(todo), 'failed': [], 'games': 0, 'wall_s': 0.0}
+    if report['skipped']:
+        print(f"resuming: {report['skipped']} of {len(matchups)} matchups already played")
+
+    def finished(matchup, result):
+        save_matchup(matchup_path(results_dir, *matchup, n_games), result)
+        report['played'] += 1
+        report['games'] += len(result['game'])
+        print(f"[{report['played']}/{len(todo)}] {matchup[0]} vs {matchup[1]} seed {matchup[2]}: "
+              f"{result['shots'].mean():.2f} shots, {len(result['game']) / result['seconds']:,.0f} games/s")
+
+    start = time.perf_counter()
+    if max_workers <= 1:
+        # no pool, useful on single-core machines and for debugging
+        for matchup in todo:
+            try:
+                finished(matchup, play_matchup(*matchup, n_games))
+            except Exception as e:
+                report['failed'].append((matchup, str(e)))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(play_matchup, *matchup, n_games): matchup for matchup in todo}
+            for future in as_completed(futures):
+                matchup = futures[future]
+                try:
+                    finished(matchup, future.result())
+                except Exception as e:
+                    # a failed matchup has no result file, so the next run retries it
+                    report['failed'].append((matchup, str(e)))
+    report['wall_s'] = time.perf_counter() - start
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('results_dir', nargs='?', default='tournament_results')
+    parser.add_argument('--seeds', type=int, default=5)
+    parser.add_argument('--games', type=int, default=200, help='games per matchup')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    report = run_tournament(args.results_dir, args.seeds, args.games, args.workers)
+    for matchup, error in report['failed']:
+        print(f"failed: {matchup[0]} vs {matchup[1]} seed {matchup[2]}: {error}", file=sys.stderr)
+    if report['played']:
+        print(f"played {report['games']:,} games in {report['wall_s']:.1f}s "
+              f"({report['games'] / report['wall_s']:,.0f} games/s)")
+
+    print(f"\n{'attacker':<24}{'placement':<22}{'games':>7}{'mean shots (95% CI)':>26}{'median':>8}"
+          f"{'max':>6}{'games/s':>10}")
+    for row in summarize(load_results(args.results_dir, args.games)):
+        interval = f"{row['mean_shots']:.2f} ({row['ci_low']:.2f}-{row['ci_high']:.2f})"
+        print(f"{row['attacker']:<24}{row['placement']:<22}{row['games']:>7}{interval:>26}"
+              f"{row['median_shots']:>8.1f}{row['max_shots']:>6}{row['games_per_s']:>10,.0f}")